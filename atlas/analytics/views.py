@@ -11,6 +11,7 @@ from django.shortcuts import render
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from index.models import Analytics
+from search import timing
 
 from atlas.decorators import admin_required
 
@@ -109,6 +110,7 @@ def index(request):
         "report": report,
         "term": term,
         "collection": collection,
+        "search_timings": timing.histogram(),
         "title": "Analytics",
     }
 
@@ -44,6 +44,15 @@ SESSION_REDIS = {
     "retry_on_timeout": False,
 }
 
+SEARCH_BUFFER_REDIS = {
+    "host": redis_url.hostname,
+    "port": redis_url.port,
+    "password": redis_url.password,
+    "db": 0,
+    "socket_timeout": 1,
+    "retry_on_timeout": False,
+}
+
 CELERY_BROKER_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
 
 DEMO = True
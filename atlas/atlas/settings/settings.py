@@ -306,6 +306,75 @@ DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 
 SOLR_URL = "http://localhost:8983/solr/atlas/"
 SOLR_LOOKUP_URL = "http://localhost:8983/solr/atlas_lookups/"
+# full rebuilds load this core, then swap it with SOLR_URL
+SOLR_SHADOW_URL = "http://localhost:8983/solr/atlas_shadow/"
+
+# solr connections are pooled per worker process
+SOLR_POOL_SIZE = 10
+SOLR_TIMEOUT = (3.05, 60)  # (connect, read) in seconds
+
+# edits made in atlas are made visible by solr within this many ms instead
+# of committing each one. bulk loads commit once, when they are done; with
+# SOLR_BULK_SOFT_COMMIT that commit is a soft commit and solr's autoCommit
+# flushes the load to disk.
+SOLR_COMMIT_WITHIN = 1000
+SOLR_BULK_SOFT_COMMIT = False
+
+# bulk loads stream their docs to solr as they are built, in requests of up
+# to this many docs.
+SOLR_UPDATE_SIZE = 10000
+
+# search results are cached until the search etl changes the index
+SEARCH_CACHE_TIMEOUT = 60 * 60 * 24
+
+# length of the description summary returned with each search hit
+SEARCH_SUMMARY_LENGTH = 160
+
+# rerank the top hits with a second query instead of boosting by the
+# indexed quality score
+SEARCH_RERANK = False
+
+# serve picker lookups from an in-memory prefix index
+SEARCH_TYPEAHEAD = False
+SEARCH_TYPEAHEAD_SCAN = 5000  # max index entries checked per lookup
+
+# identical concurrent searches share one solr request. "shared" extends
+# this across workers with a short lock in the django cache.
+SEARCH_SINGLE_FLIGHT_SHARED = False
+SEARCH_SINGLE_FLIGHT_TIMEOUT = 5  # seconds
+
+# log the stage timings of each search request to the "search.timing" logger
+SEARCH_TIMING_LOG = False
+
+# share of search requests counted in the latency histogram
+SEARCH_TIMING_SAMPLE = 0.1
+
+# replay the most frequent searches of the last days after a search etl
+SEARCH_WARM_COUNT = 50
+SEARCH_WARM_DAYS = 30
+
+# full search resets are loaded in this many parallel celery tasks
+SEARCH_ETL_PARTITIONS = 4
+
+# a full search reset that has not finished after this many seconds is taken
+# to have died, and is started again by the next delta load
+SEARCH_RESET_TIMEOUT = 60 * 60 * 2
+
+# build report search docs from model instances ("orm") or from plain rows
+# read with a few set based queries ("flat")
+SEARCH_REPORT_SOURCE = "orm"
+
+# the search signals buffer saved objects in redis, and a periodic task
+# reloads them in bulk. without SEARCH_BUFFER each save starts its own task.
+SEARCH_BUFFER = True
+SEARCH_BUFFER_FLUSH = 10  # seconds between flushes
+SEARCH_BUFFER_REDIS = {
+    "host": os.environ.get("REDIS_HOST", "localhost"),
+    "port": os.environ.get("REDIS_PORT", 6379),
+    "db": 0,
+    "socket_timeout": 1,
+    "retry_on_timeout": False,
+}
 
 # Celery configuration
 CELERY_TIMEZONE = TIME_ZONE
@@ -321,6 +390,13 @@ CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 
 CELERY_IMPORTS = ["etl.tasks.search"]
 
+CELERY_BEAT_SCHEDULE = {
+    "search buffer flush": {
+        "task": "etl.tasks.search.buffer.flush_search_buffer",
+        "schedule": SEARCH_BUFFER_FLUSH,
+    },
+}
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -333,6 +409,11 @@ LOGGING = {
         "handlers": ["console"],
         "level": "WARNING",
     },
+    "loggers": {
+        "search.timing": {
+            "level": "INFO",
+        },
+    },
 }
 
 
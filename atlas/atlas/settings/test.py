@@ -47,6 +47,10 @@ CELERY_BROKER_URL = "memory://"
 CELERY_RESULT_BACKEND = "cache+memory://"
 CELERY_ALWAYS_EAGER = True
 
+# load and commit each search update so it can be searched right away
+SOLR_COMMIT_WITHIN = None
+SEARCH_BUFFER = False
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -1,7 +1,22 @@
 """Functions shared between ETL steps."""
+import contextlib
+import hashlib
+import itertools
+import json
+from collections import Counter
 from datetime import datetime
 
 import pytz
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from search.cache import bump_generation, get_generations, increment
+from search.solr import get_solr, stream_docs
+
+COMMIT_KINDS = ["hard", "soft", "within"]
+
+# docs are hashed and looked up in the cache in chunks of this size.
+HASH_CHUNK = 500
 
 
 def chunker(seq, size):
@@ -36,3 +51,287 @@ def solr_date(date):
         )
 
     return None
+
+
+def count_commit(kind):
+    """Count a solr commit. ``kind`` is one of ``COMMIT_KINDS``."""
+    increment("search:commits:%s" % kind)
+
+
+def commit_stats():
+    """Get the commit counters."""
+    counts = cache.get_many(["search:commits:%s" % kind for kind in COMMIT_KINDS])
+
+    return {kind: counts.get("search:commits:%s" % kind, 0) for kind in COMMIT_KINDS}
+
+
+def realtime_commit(delete=False):
+    """Get the commit params of a realtime (signal driven) update.
+
+    Adds are committed by solr within ``SOLR_COMMIT_WITHIN`` ms, so edits
+    made together share one commit. pysolr cannot send commitWithin with a
+    delete, so deletes are soft committed. Without ``SOLR_COMMIT_WITHIN``
+    each update is hard committed.
+    """
+    if settings.SOLR_COMMIT_WITHIN is None:
+        count_commit("hard")
+        return {"commit": True}
+
+    if delete:
+        count_commit("soft")
+        return {"softCommit": True}
+
+    count_commit("within")
+    return {"commitWithin": settings.SOLR_COMMIT_WITHIN}
+
+
+@shared_task
+def bump_generation_later(name):
+    """Celery task to invalidate cached searches of ``name``."""
+    bump_generation(name)
+
+
+def bump_realtime(name):
+    """Invalidate cached searches of ``name`` after a realtime add.
+
+    The add is only searchable once solr commits it, so searches cached
+    before then are invalidated again when ``SOLR_COMMIT_WITHIN`` is up.
+    """
+    bump_generation(name)
+
+    if settings.SOLR_COMMIT_WITHIN is not None:
+        bump_generation_later.apply_async(
+            (name,), countdown=settings.SOLR_COMMIT_WITHIN / 1000 + 1
+        )
+
+
+def bulk_commit(url=None):
+    """Commit a bulk load once all of its batches are sent.
+
+    Returns the number of commits made, for the stats of the load.
+    """
+    if settings.SOLR_BULK_SOFT_COMMIT:
+        get_solr(url).commit(softCommit=True)
+        count_commit("soft")
+    else:
+        get_solr(url).commit()
+        count_commit("hard")
+
+    return 1
+
+
+def hash_doc(doc):
+    """Hash the content of a search doc."""
+    return hashlib.blake2b(
+        json.dumps(doc, sort_keys=True, default=str).encode("utf8"), digest_size=8
+    ).hexdigest()
+
+
+def hash_keys(doc_ids):
+    """Build the cache keys of the content hashes of docs."""
+    generation = get_generations(["doc_hashes"])[0]
+
+    return {doc_id: "search:hash:%s:%s" % (generation, doc_id) for doc_id in doc_ids}
+
+
+def add_changed(solr, docs, commit=True, skip=True):
+    """Add docs to solr, leaving out docs that did not change.
+
+    ``docs`` can be a generator. They are streamed to solr in requests of
+    up to ``SOLR_UPDATE_SIZE`` docs, so only a chunk of them is in memory at
+    a time.
+
+    The content hash of each doc sent is kept in the django cache. With
+    ``skip``, docs with the same hash as when they were last sent are not
+    sent again. The hashes are of the docs in the live core, so loads into
+    another core, like the shadow core of a rebuild, neither skip nor record
+    them. ``commit`` is as in ``realtime_commit``; without it the hashes are
+    recorded before the caller commits, so the caller must forget them if it
+    fails before its commit, see ``forget_on_failure``.
+
+    Returns a ``Counter`` of docs sent and skipped.
+    """
+    docs = iter(docs)
+    count = Counter(sent=0, skipped=0)
+    live = solr.url.rstrip("/") == settings.SOLR_URL.rstrip("/")
+
+    while True:
+        read = sum(count.values())
+        hashes: dict = {}
+
+        changed = changed_docs(
+            itertools.islice(docs, settings.SOLR_UPDATE_SIZE),
+            hashes,
+            count,
+            skip and live,
+        )
+        first = next(changed, None)
+
+        if first is not None:
+            stream_docs(
+                solr,
+                itertools.chain([first], changed),
+                **(realtime_commit() if commit else {})
+            )
+
+            if live:
+                cache.set_many(hashes, timeout=None)
+
+        if sum(count.values()) - read < settings.SOLR_UPDATE_SIZE:
+            return count
+
+
+def changed_docs(docs, hashes, count, skip=True):
+    """Yield the docs that changed since they were last sent.
+
+    The hashes of the docs yielded are added to ``hashes`` by cache key, and
+    each doc is counted in ``count`` as sent or skipped.
+    """
+    while True:
+        chunk = list(itertools.islice(docs, HASH_CHUNK))
+
+        if not chunk:
+            return
+
+        keys = hash_keys(doc["id"] for doc in chunk)
+        sent = cache.get_many(list(keys.values())) if skip else {}
+
+        for doc in chunk:
+            key = keys[doc["id"]]
+            digest = hash_doc(doc)
+
+            if sent.get(key) == digest:
+                count["skipped"] += 1
+                continue
+
+            hashes[key] = digest
+            count["sent"] += 1
+
+            yield doc
+
+
+def update_fields(solr, docs, fields, commit=True):
+    """Update some fields of docs in solr in place.
+
+    ``fields`` maps each field to its atomic update: "set", "add" or
+    "remove". Each doc must already be in solr; "_version_" 1 makes solr
+    reject the update instead of adding a partial doc. ``commit`` is as in
+    ``realtime_commit``.
+
+    The content hashes of the docs are forgotten, so their next full load
+    is sent. Returns the number of docs updated.
+    """
+    solr.add(
+        [{**doc, "_version_": 1} for doc in docs],
+        fieldUpdates=fields,
+        **(realtime_commit() if commit else {})
+    )
+    forget_docs(doc["id"] for doc in docs)
+
+    return len(docs)
+
+
+def is_version_conflict(error):
+    """Check if solr rejected an update for its "_version_"."""
+    return "version conflict" in str(error)
+
+
+def forget_docs(doc_ids):
+    """Forget the content hashes of docs removed from solr."""
+    cache.delete_many(list(hash_keys(doc_ids).values()))
+
+
+def forget_all_docs():
+    """Forget all content hashes, when the whole index is replaced."""
+    bump_generation("doc_hashes")
+
+
+@contextlib.contextmanager
+def forget_on_failure():
+    """Forget all content hashes if a load fails before its commit.
+
+    The hashes of the docs sent without a commit are already recorded, so
+    the next loads would skip docs that never became searchable.
+    """
+    try:
+        yield
+    except Exception:
+        forget_all_docs()
+        raise
+
+
+def get_watermark(search_type):
+    """Get the time the last search load of a type started.
+
+    Returns None if the type was never loaded, or the mark was evicted.
+    """
+    return cache.get("search:watermark:%s" % search_type)
+
+
+def set_watermark(search_type, started):
+    """Save the time a search load of a type started."""
+    cache.set("search:watermark:%s" % search_type, started, timeout=None)
+
+
+def swap_watermarks(search_types):
+    """Swap the watermarks of the live and shadow cores, when they are swapped.
+
+    A core without a watermark makes the next delta fully reset its types.
+    """
+    for search_type in search_types:
+        live_key = "search:watermark:%s" % search_type
+        shadow_key = "search:watermark:shadow:%s" % search_type
+
+        marks = cache.get_many([live_key, shadow_key])
+
+        for key, mark in [
+            (live_key, marks.get(shadow_key)),
+            (shadow_key, marks.get(live_key)),
+        ]:
+            if mark is None:
+                cache.delete(key)
+            else:
+                cache.set(key, mark, timeout=None)
+
+
+def solr_ids(search_type):
+    """Get the atlas ids of all docs of a type in solr."""
+    solr = get_solr()
+
+    ids = set()
+    cursor = "*"
+
+    while True:
+        results = solr.search(
+            "type:%s" % search_type,
+            fl="atlas_id",
+            sort="id asc",
+            rows=10000,
+            cursorMark=cursor,
+        )
+        ids.update(doc["atlas_id"][0] for doc in results.docs)
+
+        if results.nextCursorMark in [None, cursor]:
+            return ids
+
+        cursor = results.nextCursorMark
+
+
+def delete_missing(search_type, ids):
+    """Remove docs of a type from solr that are not in ``ids``.
+
+    The deletes are left for the caller to commit. Returns the removed
+    atlas ids.
+    """
+    missing = sorted(solr_ids(search_type) - set(ids))
+
+    solr = get_solr()
+
+    for chunk in chunker(missing, 500):
+        solr.delete(
+            q="type:%s AND atlas_id:(%s)"
+            % (search_type, " OR ".join(str(atlas_id) for atlas_id in chunk))
+        )
+        forget_docs("/%s/%s" % (search_type, atlas_id) for atlas_id in chunk)
+
+    return missing
@@ -0,0 +1,174 @@
+"""Buffered search updates.
+
+The search signals used to start one celery task per saved object, so an
+upstream load that saves thousands of rows also queued thousands of tasks,
+each querying the database for a single doc. With ``SEARCH_BUFFER`` the
+signals add the ids of saved objects to a redis set per type instead, and a
+periodic task reloads all the buffered ids of a type in bulk. An object
+saved many times between two flushes is reloaded once.
+
+Lookups are buffered in a redis hash of their doc fields, keyed by solr id.
+The term and collection links of reports are buffered by report id, and
+only updated for the reports that are not reloaded in full.
+"""
+import importlib
+import json
+import logging
+from collections import Counter
+
+import redis
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from etl.tasks.functions import chunker
+
+logger = logging.getLogger(__name__)
+
+BUFFER_TYPES = ["reports", "terms", "collections", "initiatives", "users"]
+
+# ids are loaded in chunks to keep the sql "in" list short.
+CHUNK_SIZE = 1000
+
+_client = None
+
+
+def get_redis():
+    """Get the buffer's redis client."""
+    global _client  # pylint: disable=W0603
+
+    if _client is None:
+        _client = redis.Redis(**settings.SEARCH_BUFFER_REDIS)
+
+    return _client
+
+
+def buffer_key(search_type):
+    """Build the redis key of a type's buffer."""
+    return "atlas_search_buffer:%s" % search_type
+
+
+def queue_load(search_type, atlas_id, task):
+    """Queue an object to be reloaded by the next flush.
+
+    Without ``SEARCH_BUFFER``, or if redis is down, ``task`` reloads it now.
+    """
+    if settings.SEARCH_BUFFER:
+        try:
+            get_redis().sadd(buffer_key(search_type), atlas_id)
+            return
+        except redis.RedisError as e:
+            logger.warning("Search buffer is offline: %s", e)
+
+    task.delay(atlas_id)
+
+
+def queue_loads(touched, task):
+    """Queue objects of several types to be reloaded by the next flush.
+
+    ``touched`` maps each search type to a list of ids. Without
+    ``SEARCH_BUFFER``, or if redis is down, ``task`` reloads them in one batch
+    once the transaction commits.
+    """
+    if settings.SEARCH_BUFFER:
+        try:
+            pipe = get_redis().pipeline()
+            for search_type, ids in touched.items():
+                pipe.sadd(buffer_key(search_type), *ids)
+            pipe.execute()
+            return
+        except redis.RedisError as e:
+            logger.warning("Search buffer is offline: %s", e)
+
+    transaction.on_commit(lambda: task.delay(touched))
+
+
+def queue_lookup(item_type, item_id, item_name, task):
+    """Queue a lookup to be reloaded by the next flush.
+
+    Without ``SEARCH_BUFFER``, or if redis is down, ``task`` reloads it now.
+    """
+    if settings.SEARCH_BUFFER:
+        try:
+            get_redis().hset(
+                buffer_key("lookups"),
+                "%s_%s" % (item_type, item_id),
+                json.dumps([item_type, item_id, item_name]),
+            )
+            return
+        except redis.RedisError as e:
+            logger.warning("Search buffer is offline: %s", e)
+
+    task.delay(item_type, item_id, item_name)
+
+
+def take(key, command):
+    """Read a buffer with ``command`` and empty it in one transaction."""
+    pipe = get_redis().pipeline()
+    getattr(pipe, command)(key)
+    pipe.delete(key)
+
+    return pipe.execute()[0]
+
+
+@shared_task
+def flush_search_buffer():
+    """Reload the buffered objects of each type in bulk.
+
+    Then update the buffered links of reports, and reload the lookups. Ids
+    that fail to load are put back in the buffer for the next flush.
+    Returns the docs sent and skipped by type.
+    """
+    counts = {}
+    flushed = {}
+
+    for search_type in BUFFER_TYPES:
+        ids = sorted(
+            int(atlas_id) for atlas_id in take(buffer_key(search_type), "smembers")
+        )
+        flushed[search_type] = ids
+        if not ids:
+            continue
+
+        module = importlib.import_module("etl.tasks.search.%s" % search_type)
+        load = getattr(module, "load_%s" % search_type)
+
+        try:
+            counts[search_type] = dict(
+                sum((load(ids=chunk) for chunk in chunker(ids, CHUNK_SIZE)), Counter())
+            )
+        except Exception:
+            get_redis().sadd(buffer_key(search_type), *ids)
+            raise
+
+    # reports loaded in full already have their new links.
+    ids = sorted(
+        {int(atlas_id) for atlas_id in take(buffer_key("report_links"), "smembers")}
+        - set(flushed["reports"])
+    )
+    if ids:
+        module = importlib.import_module("etl.tasks.search.reports")
+
+        try:
+            counts["report_links"] = {
+                "sent": sum(
+                    module.update_report_links(ids=chunk)
+                    for chunk in chunker(ids, CHUNK_SIZE)
+                )
+            }
+        except Exception:
+            get_redis().sadd(buffer_key("report_links"), *ids)
+            raise
+
+    lookups = take(buffer_key("lookups"), "hgetall")
+    if lookups:
+        module = importlib.import_module("etl.tasks.search.lookups")
+
+        try:
+            module.load_lookups([json.loads(lookup) for lookup in lookups.values()])
+        except Exception:
+            get_redis().hset(buffer_key("lookups"), mapping=lookups)
+            raise
+
+        counts["lookups"] = {"sent": len(lookups)}
+
+    return counts
@@ -1,30 +1,112 @@
 """Celery tasks to keep collection search up to date."""
 import contextlib
+import itertools
+import time
 
-import pysolr
 from celery import shared_task
-from django.conf import settings
 from django.db.models import Q
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django_chunked_iterator import batch_iterator
-from etl.tasks.functions import clean_doc, solr_date
-from index.models import Collections
+from etl.tasks.functions import (
+    add_changed,
+    bump_realtime,
+    clean_doc,
+    delete_missing,
+    forget_docs,
+    realtime_commit,
+    solr_date,
+)
+from etl.tasks.search.buffer import queue_load
+from etl.tasks.search.dependencies import queue_dependents
+from etl.tasks.search.partitions import partitioned_load
+from etl.tasks.search.suppress import reindex_dependents, suppressed
+from index.models import CollectionReports, Collections, CollectionTerms
+from search import collection_ads, typeahead
+from search.cache import bump_generation
+from search.solr import get_solr
 
 
 @receiver(pre_delete, sender=Collections)
 def deleted_collection(sender, instance, **kwargs):
     """When collection is delete, remove it from search."""
+    if suppressed("collections", instance.collection_id, deleted=True):
+        return
+
+    queue_dependents("collections", instance.collection_id, reindex_dependents)
+
+    collection_ads.remove_collection(instance.collection_id)
+    typeahead.publish_change("collections", instance.collection_id)
     delete_collection.delay(instance.collection_id)
 
 
 @receiver(post_save, sender=Collections)
 def updated_collection(sender, instance, **kwargs):
     """When collection is updated, add it to search."""
+    if suppressed("collections", instance.collection_id):
+        return
+
+    queue_dependents("collections", instance.collection_id, reindex_dependents)
+
+    collection_ads.update_collection(instance)
+    typeahead.publish_change(
+        "collections",
+        instance.collection_id,
+        None if instance.hidden == "Y" else str(instance),
+    )
+
     if instance.hidden == "Y":
         delete_collection.delay(instance.collection_id)
     else:
-        load_collection.delay(instance.collection_id)
+        queue_load("collections", instance.collection_id, load_collection)
+
+
+@receiver(post_save, sender=CollectionReports)
+def updated_collection_report(sender, instance, **kwargs):
+    """When a report is added to a collection, update it in search."""
+    if instance.collection_id is None or suppressed(
+        "collections", instance.collection_id
+    ):
+        return
+
+    collection_ads.add_report_link(instance.collection_id, instance.report_id)
+    queue_load("collections", instance.collection_id, load_collection)
+
+
+@receiver(post_delete, sender=CollectionReports)
+def deleted_collection_report(sender, instance, **kwargs):
+    """When a report is removed from a collection, update it in search."""
+    if instance.collection_id is None or suppressed(
+        "collections", instance.collection_id
+    ):
+        return
+
+    collection_ads.remove_report_link(instance.collection_id, instance.report_id)
+    queue_load("collections", instance.collection_id, load_collection)
+
+
+@receiver(post_save, sender=CollectionTerms)
+def updated_collection_term(sender, instance, **kwargs):
+    """When a term is added to a collection, update it in search."""
+    if instance.collection_id is None or suppressed(
+        "collections", instance.collection_id
+    ):
+        return
+
+    collection_ads.add_term_link(instance.collection_id, instance.term_id)
+    queue_load("collections", instance.collection_id, load_collection)
+
+
+@receiver(post_delete, sender=CollectionTerms)
+def deleted_collection_term(sender, instance, **kwargs):
+    """When a term is removed from a collection, update it in search."""
+    if instance.collection_id is None or suppressed(
+        "collections", instance.collection_id
+    ):
+        return
+
+    collection_ads.remove_term_link(instance.collection_id, instance.term_id)
+    queue_load("collections", instance.collection_id, load_collection)
 
 
 @shared_task
@@ -35,9 +117,15 @@ def delete_collection(collection_id):
 
 def delete_collection_function(collection_id):
     """In process delete function."""
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    solr = get_solr()
+
+    solr.delete(
+        q="type:collections AND atlas_id:%s" % collection_id,
+        **realtime_commit(delete=True)
+    )
+    forget_docs(["/collections/%s" % collection_id])
 
-    solr.delete(q="type:collections AND atlas_id:%s" % collection_id)
+    bump_generation("collections")
 
 
 @shared_task
@@ -50,23 +138,64 @@ def load_collection(collection_id):
 def reset_collections():
     """Reset collection group in solr.
 
-    1. Delete all collections from Solr
-    2. Query all existing collections
-    3. Load data to solr.
+    1. Load data to solr in partitions across the ETL workers
+    2. Remove the collections that are no longer in the database
+    3. Commit once, reset the search caches and warm them.
     """
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    started = time.time()
 
-    solr.delete(q="type:collections")
-    solr.optimize()
+    partitioned_load("collections", started)
 
-    load_collections()
 
+def delta_collections(since):
+    """Reload collections changed since a time and remove deleted ones.
 
-def load_collections(collection_id=None):
+    Hidden collections count as deleted. The changes are left for the
+    caller to commit. Returns a ``Counter`` of docs sent and skipped.
+    """
+    counts = load_collections(changed_since=since, commit=False)
+
+    delete_missing(
+        "collections",
+        Collections.objects.filter(~Q(hidden="Y") | Q(hidden=None)).values_list(
+            "collection_id", flat=True
+        ),
+    )
+
+    collection_ads.reset_collection_ads()
+    typeahead.reset_typeahead("collections")
+
+    return counts
+
+
+def changed_collections(since):
+    """Filter collections whose search doc may have changed since a time."""
+    return (
+        Q(_modified_at__gt=since)
+        | Q(initiative___modified_at__gt=since)
+        | Q(terms__term___modified_at__gt=since)
+        | Q(reports__report___modified_at__gt=since)
+        | Q(reports__report__etl_date__gt=since)
+        | Q(reports__report__docs___modified_at__gt=since)
+    )
+
+
+def load_collections(
+    collection_id=None,
+    changed_since=None,
+    id_range=None,
+    ids=None,
+    url=None,
+    commit=True,
+    skip=True,
+):
     """Load a group of collections to solr database.
 
     1. Convert the objects to list of dicts
     2. Bulk load to solr in batchs of x
+
+    With ``skip`` docs that did not change since they were last sent are not
+    sent again. Returns a ``Counter`` of docs sent and skipped.
     """
     collections = (
         Collections.objects.filter(~Q(hidden="Y") | Q(hidden=None))
@@ -82,19 +211,47 @@ def load_collections(collection_id=None):
     if collection_id:
         collections = collections.filter(collection_id=collection_id)
 
-    if len(collections) == 0:
+    if id_range:
+        collections = collections.filter(
+            collection_id__gte=id_range[0], collection_id__lt=id_range[1]
+        )
+
+    if ids is not None:
+        collections = collections.filter(collection_id__in=ids)
+
+    if changed_since:
+        collections = collections.filter(
+            collection_id__in=Collections.objects.filter(
+                changed_collections(changed_since)
+            ).values("collection_id")
+        )
+
+    if collection_id and len(collections) == 0:
         delete_collection_function(collection_id)
 
-    # reset the batch. reports will be loaded to solr in batches
-    # of "batch_size"
-    list(map(solr_load_batch, batch_iterator(collections.all(), batch_size=1000)))
+    # rows are read in batches of "batch_size" and streamed to solr.
+    count = solr_load_batch(
+        itertools.chain.from_iterable(
+            batch_iterator(collections.all(), batch_size=1000)
+        ),
+        url=url,
+        commit=commit,
+        skip=skip,
+    )
+
+    # bulk loads invalidate the cached searches once they commit.
+    if commit and count["sent"]:
+        bump_realtime("collections")
 
+    return count
 
-def solr_load_batch(batch):
-    """Process batch."""
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
 
-    solr.add(list(map(build_doc, batch)))
+def solr_load_batch(batch, url=None, commit=True, skip=True):
+    """Process batch.
+
+    Without ``commit`` the docs are left for the caller to commit.
+    """
+    return add_changed(get_solr(url), map(build_doc, batch), commit=commit, skip=skip)
 
 
 def build_doc(collection):
@@ -106,7 +263,6 @@ def build_doc(collection):
         "name": str(collection),
         "visible": "Y",
         "orphan": "N",
-        "runs": 10,
         "description": [collection.search_summary, collection.description],
         "last_updated": solr_date(collection._modified_at),
         "updated_by": str(collection.modified_by),
@@ -0,0 +1,154 @@
+"""Search index consistency check.
+
+Compares the search docs of each type with the database, and repairs only
+the docs that differ, instead of a full reset. The ids and modified dates
+are streamed in id order from both the database and a solr cursor, and
+merged like a sorted join, so neither side is held in memory.
+
+A doc is:
+
+- missing when its row is not in solr
+- orphaned when its row is no longer in the database
+- stale when the modified dates of its row differ from the doc's.
+
+Solr sorts the cursor on the string id, so the database rows are sorted on
+the string form of their key to match.
+"""
+from celery import shared_task
+from django.core.cache import cache
+from django.db.models import CharField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from etl.tasks.functions import forget_docs, solr_date
+from etl.tasks.search.partitions import partition_queryset, reset_running
+from etl.tasks.search.suppress import reindex_objects
+from search.solr import get_solr
+
+CHECK_TYPES = ["reports", "terms", "collections", "initiatives", "users"]
+
+# modified date columns of each type, and the doc fields they are stored in.
+# users have no modified date, so they are only checked for missing docs.
+STAMPS = {
+    "reports": {
+        "_modified_at": "report_last_updated",
+        "docs___modified_at": "last_updated",
+        "etl_date": "last_load_date",
+    },
+    "terms": {"_modified_at": "last_updated"},
+    "collections": {"_modified_at": "last_updated"},
+    "initiatives": {"_modified_at": "last_updated"},
+}
+
+PAGE_SIZE = 5000
+
+
+def db_rows(search_type):
+    """Stream the (id, modified dates) of a type's rows, in id string order."""
+    queryset, key = partition_queryset(search_type)
+    columns = list(STAMPS.get(search_type, {}))
+
+    rows = (
+        queryset.order_by(Cast(key, output_field=CharField()))
+        .values_list(key, *columns)
+        .iterator(chunk_size=PAGE_SIZE)
+    )
+
+    for row in rows:
+        yield str(row[0]), tuple(solr_date(value) for value in row[1:])
+
+
+def solr_rows(search_type):
+    """Stream the (id, modified dates) of a type's docs, in id order."""
+    solr = get_solr()
+    fields = list(STAMPS.get(search_type, {}).values())
+
+    cursor = "*"
+
+    while True:
+        results = solr.search(
+            "type:%s" % search_type,
+            fl=",".join(["atlas_id"] + fields),
+            sort="id asc",
+            rows=PAGE_SIZE,
+            cursorMark=cursor,
+        )
+
+        for doc in results.docs:
+            yield str(doc["atlas_id"][0]), tuple(doc.get(field) for field in fields)
+
+        if results.nextCursorMark in [None, cursor]:
+            return
+
+        cursor = results.nextCursorMark
+
+
+def diff_rows(db, solr):
+    """Merge two streams of (id, modified dates) sorted on id.
+
+    Yields (id, "missing" | "orphaned" | "stale") for each id that differs.
+    """
+    db_row = next(db, None)
+    solr_row = next(solr, None)
+
+    while db_row is not None or solr_row is not None:
+        if solr_row is None or (db_row is not None and db_row[0] < solr_row[0]):
+            yield db_row[0], "missing"
+            db_row = next(db, None)
+
+        elif db_row is None or solr_row[0] < db_row[0]:
+            yield solr_row[0], "orphaned"
+            solr_row = next(solr, None)
+
+        else:
+            if db_row[1] != solr_row[1]:
+                yield db_row[0], "stale"
+
+            db_row = next(db, None)
+            solr_row = next(solr, None)
+
+
+@shared_task
+def check_search(repair=True):
+    """Find and repair the search docs that differ from the database.
+
+    With ``repair`` the missing and stale docs are reloaded and the orphaned
+    docs removed, with one commit. Types that are being reset are skipped, as
+    their docs are not committed yet. The summary is kept for the ETL
+    dashboard. Returns the number of docs of each kind by type.
+    """
+    summary = {}
+    touched = {}
+
+    for search_type in CHECK_TYPES:
+        if reset_running(search_type):
+            continue
+
+        found = {"missing": [], "orphaned": [], "stale": []}
+
+        for atlas_id, kind in diff_rows(db_rows(search_type), solr_rows(search_type)):
+            found[kind].append(int(atlas_id))
+
+        summary[search_type] = {kind: len(ids) for kind, ids in found.items()}
+
+        ids = sorted(found["missing"] + found["orphaned"] + found["stale"])
+        if ids:
+            touched[search_type] = ids
+
+            # the docs differ from solr, so their last sent hash is wrong.
+            forget_docs("/%s/%s" % (search_type, atlas_id) for atlas_id in ids)
+
+    if repair and touched:
+        reindex_objects(touched)
+
+    cache.set(
+        "search:consistency",
+        {"checked": timezone.now(), "types": summary},
+        timeout=None,
+    )
+
+    return summary
+
+
+def consistency_stats():
+    """Get the summary of the last consistency check, or None."""
+    return cache.get("search:consistency")
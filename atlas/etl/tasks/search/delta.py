@@ -0,0 +1,83 @@
+"""Celery task to reload only the search docs that changed."""
+from datetime import timedelta
+
+from celery import shared_task
+from django.utils import timezone
+from etl.tasks.functions import (
+    bulk_commit,
+    forget_on_failure,
+    get_watermark,
+    set_watermark,
+)
+from etl.tasks.search.collections import delta_collections, reset_collections
+from etl.tasks.search.initiatives import delta_initiatives, reset_initiatives
+from etl.tasks.search.partitions import reset_running
+from etl.tasks.search.reports import delta_reports, reset_reports
+from etl.tasks.search.terms import delta_terms, reset_terms
+from search.cache import bump_generation
+from search.warming import warm_searches
+
+# changes are looked up a bit before the last run started, in case the
+# database and worker clocks disagree.
+OVERLAP = timedelta(minutes=5)
+
+
+@shared_task
+def delta_search():
+    """Reload search docs changed since the last load of their type.
+
+    1. Fully reset types that have no watermark
+    2. Wait for the next run while any reset is running, as a commit would
+       make its partly loaded type searchable
+    3. Reload docs whose row, or a related row, changed since the watermark
+    4. Remove docs whose row was deleted
+    5. Commit once and reset the search caches of the reloaded types
+    6. Warm the search caches.
+
+    Users have no modification date and are only reloaded by their reset.
+    Returns the docs sent and skipped by type, the number of commits and the
+    types being reset.
+    """
+    loaded = {}
+    counts = {}
+
+    types = [
+        ("reports", delta_reports, reset_reports),
+        ("terms", delta_terms, reset_terms),
+        ("collections", delta_collections, reset_collections),
+        ("initiatives", delta_initiatives, reset_initiatives),
+    ]
+
+    for search_type, _, reset in types:
+        if get_watermark(search_type) is None and not reset_running(search_type):
+            reset()
+
+    resetting = [
+        search_type
+        for search_type in ["reports", "terms", "collections", "initiatives", "users"]
+        if reset_running(search_type)
+    ]
+
+    if resetting:
+        return {"docs": counts, "commits": 0, "resetting": resetting}
+
+    with forget_on_failure():
+        for search_type, delta, _ in types:
+            started = timezone.now()
+            since = get_watermark(search_type)
+
+            if since is None:
+                continue
+
+            counts[search_type] = dict(delta(since - OVERLAP))
+            loaded[search_type] = started
+
+        commits = bulk_commit() if loaded else 0
+
+    for search_type, started in loaded.items():
+        bump_generation(search_type)
+        set_watermark(search_type, started)
+
+    warm_searches()
+
+    return {"docs": counts, "commits": commits, "resetting": resetting}
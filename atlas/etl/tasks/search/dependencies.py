@@ -0,0 +1,71 @@
+"""Search doc dependencies.
+
+Search docs embed the names and descriptions of the objects they are linked
+to: a report doc has the summaries of its terms and the descriptions of its
+collections and initiatives, and so on. When a term, collection or
+initiative changes, the docs that embed it are stale too.
+
+``DEPENDENTS`` maps each type to the lookup from every other type that
+embeds it. The signals find all the dependent ids in one query and queue
+them to be reloaded in one batch. Inside ``suppress_search_signals`` the
+dependents of all the objects saved in the block are found once, by the
+reindex.
+"""
+from django.db.models import CharField, Value
+from etl.tasks.search.buffer import queue_loads
+from etl.tasks.search.partitions import partition_queryset
+
+DEPENDENTS = {
+    "terms": {
+        "reports": "docs__terms__term",
+        "collections": "terms__term",
+        "initiatives": "collections__terms__term",
+    },
+    "collections": {
+        "reports": "collections__collection",
+        "terms": "collections__collection",
+        "initiatives": "collections",
+    },
+    "initiatives": {
+        "reports": "collections__collection__initiative",
+        "terms": "collections__collection__initiative",
+        "collections": "initiative",
+    },
+}
+
+
+def dependent_ids(search_type, ids):
+    """Get the ids of the docs that embed any of the objects, by type."""
+    queries = []
+    for dependent_type, lookup in DEPENDENTS.get(search_type, {}).items():
+        queryset, key = partition_queryset(dependent_type)
+        queries.append(
+            queryset.filter(**{"%s__in" % lookup: ids})
+            .annotate(dependent_type=Value(dependent_type, output_field=CharField()))
+            .order_by()
+            .values_list(key, "dependent_type")
+        )
+
+    if not queries:
+        return {}
+
+    touched: dict = {}
+    for dependent_id, dependent_type in queries[0].union(*queries[1:]):
+        touched.setdefault(dependent_type, []).append(dependent_id)
+
+    return {
+        dependent_type: sorted(dependent_ids)
+        for dependent_type, dependent_ids in touched.items()
+    }
+
+
+def queue_dependents(search_type, atlas_id, task):
+    """Queue the docs that embed an object to be reloaded.
+
+    Their own names are unchanged, so ``task`` should not reset the
+    typeahead or collection ads for them.
+    """
+    touched = dependent_ids(search_type, [atlas_id])
+
+    if touched:
+        queue_loads(touched, task)
@@ -1,34 +1,65 @@
 """Celery tasks to keep initiative search up to date."""
 import contextlib
+import itertools
+import time
 
-import pysolr
 from celery import shared_task
-from django.conf import settings
+from django.db.models import Q
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 from django_chunked_iterator import batch_iterator
-from etl.tasks.functions import clean_doc, solr_date
+from etl.tasks.functions import (
+    add_changed,
+    bump_realtime,
+    clean_doc,
+    delete_missing,
+    forget_docs,
+    realtime_commit,
+    solr_date,
+)
+from etl.tasks.search.buffer import queue_load
+from etl.tasks.search.dependencies import queue_dependents
+from etl.tasks.search.partitions import partitioned_load
+from etl.tasks.search.suppress import reindex_dependents, suppressed
 from index.models import Initiatives
+from search.cache import bump_generation
+from search.solr import get_solr
 
 
 @receiver(pre_delete, sender=Initiatives)
 def deleted_initiative(sender, instance, **kwargs):
     """When initiative is delete, remove it from search."""
+    if suppressed("initiatives", instance.initiative_id, deleted=True):
+        return
+
+    queue_dependents("initiatives", instance.initiative_id, reindex_dependents)
+
     delete_initiative.delay(instance.initiative_id)
 
 
 @receiver(post_save, sender=Initiatives)
 def updated_initiative(sender, instance, **kwargs):
     """When initiative is updated, add it to search."""
-    load_initiative.delay(instance.initiative_id)
+    if suppressed("initiatives", instance.initiative_id):
+        return
+
+    queue_dependents("initiatives", instance.initiative_id, reindex_dependents)
+
+    queue_load("initiatives", instance.initiative_id, load_initiative)
 
 
 @shared_task
 def delete_initiative(initiative_id):
     """Celery task to remove a initiative from search."""
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    solr = get_solr()
 
-    solr.delete(q="type:initiatives AND atlas_id:%s" % initiative_id)
+    solr.delete(
+        q="type:initiatives AND atlas_id:%s" % initiative_id,
+        **realtime_commit(delete=True)
+    )
+    forget_docs(["/initiatives/%s" % initiative_id])
+
+    bump_generation("initiatives")
 
 
 @shared_task
@@ -41,23 +72,58 @@ def load_initiative(initiative_id):
 def reset_initiatives():
     """Reset initiative group in solr.
 
-    1. Delete all initiatives from Solr
-    2. Query all existing initiatives
-    3. Load data to solr.
+    1. Load data to solr in partitions across the ETL workers
+    2. Remove the initiatives that are no longer in the database
+    3. Commit once, reset the search caches and warm them.
     """
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    started = time.time()
 
-    solr.delete(q="type:initiatives")
-    solr.optimize()
+    partitioned_load("initiatives", started)
 
-    load_initiatives()
 
+def delta_initiatives(since):
+    """Reload initiatives changed since a time and remove deleted ones.
 
-def load_initiatives(initiative_id=None):
+    The changes are left for the caller to commit. Returns a ``Counter`` of
+    docs sent and skipped.
+    """
+    counts = load_initiatives(changed_since=since, commit=False)
+
+    delete_missing(
+        "initiatives", Initiatives.objects.values_list("initiative_id", flat=True)
+    )
+
+    return counts
+
+
+def changed_initiatives(since):
+    """Filter initiatives whose search doc may have changed since a time."""
+    return (
+        Q(_modified_at__gt=since)
+        | Q(collections___modified_at__gt=since)
+        | Q(collections__terms__term___modified_at__gt=since)
+        | Q(collections__reports__report___modified_at__gt=since)
+        | Q(collections__reports__report__etl_date__gt=since)
+        | Q(collections__reports__report__docs___modified_at__gt=since)
+    )
+
+
+def load_initiatives(
+    initiative_id=None,
+    changed_since=None,
+    id_range=None,
+    ids=None,
+    url=None,
+    commit=True,
+    skip=True,
+):
     """Load a group of initiatives to solr database.
 
     1. Convert the objects to list of dicts
     2. Bulk load to solr in batchs of x
+
+    With ``skip`` docs that did not change since they were last sent are not
+    sent again. Returns a ``Counter`` of docs sent and skipped.
     """
     initiatives = (
         Initiatives.objects.select_related("ops_owner")
@@ -75,16 +141,44 @@ def load_initiatives(initiative_id=None):
     if initiative_id:
         initiatives = initiatives.filter(initiative_id=initiative_id)
 
-    # reset the batch. reports will be loaded to solr in batches
-    # of "batch_size"
-    list(map(solr_load_batch, batch_iterator(initiatives.all(), batch_size=1000)))
+    if id_range:
+        initiatives = initiatives.filter(
+            initiative_id__gte=id_range[0], initiative_id__lt=id_range[1]
+        )
+
+    if ids is not None:
+        initiatives = initiatives.filter(initiative_id__in=ids)
+
+    if changed_since:
+        initiatives = initiatives.filter(
+            initiative_id__in=Initiatives.objects.filter(
+                changed_initiatives(changed_since)
+            ).values("initiative_id")
+        )
+
+    # rows are read in batches of "batch_size" and streamed to solr.
+    count = solr_load_batch(
+        itertools.chain.from_iterable(
+            batch_iterator(initiatives.all(), batch_size=1000)
+        ),
+        url=url,
+        commit=commit,
+        skip=skip,
+    )
 
+    # bulk loads invalidate the cached searches once they commit.
+    if commit and count["sent"]:
+        bump_realtime("initiatives")
 
-def solr_load_batch(batch):
-    """Process batch."""
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    return count
 
-    solr.add(list(map(build_doc, batch)))
+
+def solr_load_batch(batch, url=None, commit=True, skip=True):
+    """Process batch.
+
+    Without ``commit`` the docs are left for the caller to commit.
+    """
+    return add_changed(get_solr(url), map(build_doc, batch), commit=commit, skip=skip)
 
 
 def build_doc(initiative):
@@ -96,7 +190,6 @@ def build_doc(initiative):
         "name": str(initiative),
         "visible": "Y",
         "orphan": "N",
-        "runs": 10,
         "operations_owner": str(initiative.ops_owner),
         "description": initiative.description,
         "executive_owner": str(initiative.exec_owner),
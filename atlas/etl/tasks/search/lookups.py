@@ -1,9 +1,10 @@
 """Celery tasks to keep lookup values up to date."""
-import pysolr
 from celery import shared_task
 from django.conf import settings
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
+from etl.tasks.functions import bulk_commit, bump_realtime, realtime_commit
+from etl.tasks.search.buffer import queue_lookup
 from index.models import (
     CollectionMilestoneFrequency,
     CollectionMilestoneTemplates,
@@ -18,6 +19,8 @@ from index.models import (
     StrategicImportance,
     UserRoles,
 )
+from search.cache import bump_generation
+from search.solr import get_solr
 
 
 @receiver(pre_delete, sender=FinancialImpact)
@@ -29,7 +32,7 @@ def deleted_financial_impact(sender, instance, **kwargs):
 @receiver(post_save, sender=FinancialImpact)
 def updated_financial_impact(sender, instance, **kwargs):
     """When financial_impac is updated, add it to search."""
-    load_lookup.delay("financial_impact", instance.impact_id, str(instance))
+    queue_lookup("financial_impact", instance.impact_id, str(instance), load_lookup)
 
 
 @receiver(pre_delete, sender=RunFrequency)
@@ -41,7 +44,7 @@ def deleted_run_frequency(sender, instance, **kwargs):
 @receiver(post_save, sender=RunFrequency)
 def updated_run_frequency(sender, instance, **kwargs):
     """When financial_impac is updated, add it to search."""
-    load_lookup.delay("run_frequency", instance.frequency_id, str(instance))
+    queue_lookup("run_frequency", instance.frequency_id, str(instance), load_lookup)
 
 
 @receiver(pre_delete, sender=OrganizationalValue)
@@ -53,7 +56,7 @@ def deleted_organizational_value(sender, instance, **kwargs):
 @receiver(post_save, sender=OrganizationalValue)
 def updated_organizational_value(sender, instance, **kwargs):
     """When organizational_value is updated, add it to search."""
-    load_lookup.delay("organizational_value", instance.value_id, str(instance))
+    queue_lookup("organizational_value", instance.value_id, str(instance), load_lookup)
 
 
 @receiver(pre_delete, sender=Fragility)
@@ -65,7 +68,7 @@ def deleted_fragility(sender, instance, **kwargs):
 @receiver(post_save, sender=Fragility)
 def updated_fragility(sender, instance, **kwargs):
     """When fragility is updated, add it to search."""
-    load_lookup.delay("fragility", instance.fragility_id, str(instance))
+    queue_lookup("fragility", instance.fragility_id, str(instance), load_lookup)
 
 
 @receiver(pre_delete, sender=MaintenanceSchedule)
@@ -77,7 +80,9 @@ def deleted_maintenance_schedule(sender, instance, **kwargs):
 @receiver(post_save, sender=MaintenanceSchedule)
 def updated_maintenance_schedule(sender, instance, **kwargs):
     """When maintenance_schedule is updated, add it to search."""
-    load_lookup.delay("maintenance_schedule", instance.schedule_id, str(instance))
+    queue_lookup(
+        "maintenance_schedule", instance.schedule_id, str(instance), load_lookup
+    )
 
 
 @receiver(pre_delete, sender=FragilityTag)
@@ -89,7 +94,7 @@ def deleted_fragility_tag(sender, instance, **kwargs):
 @receiver(post_save, sender=FragilityTag)
 def updated_fragility_tag(sender, instance, **kwargs):
     """When fragility_tag is updated, add it to search."""
-    load_lookup.delay("fragility_tag", instance.tag_id, str(instance))
+    queue_lookup("fragility_tag", instance.tag_id, str(instance), load_lookup)
 
 
 @receiver(pre_delete, sender=MaintenanceLogStatus)
@@ -101,7 +106,9 @@ def deleted_maintenance_log_status(sender, instance, **kwargs):
 @receiver(post_save, sender=MaintenanceLogStatus)
 def updated_maintenance_log_status(sender, instance, **kwargs):
     """When maintenance_log_status is updated, add it to search."""
-    load_lookup.delay("maintenance_log_status", instance.status_id, str(instance))
+    queue_lookup(
+        "maintenance_log_status", instance.status_id, str(instance), load_lookup
+    )
 
 
 @receiver(pre_delete, sender=InitiativeContacts)
@@ -113,7 +120,7 @@ def deleted_initiative_contacts(sender, instance, **kwargs):
 @receiver(post_save, sender=InitiativeContacts)
 def updated_initiative_contacts(sender, instance, **kwargs):
     """When initiative_contacts is updated, add it to search."""
-    load_lookup.delay("initiative_contacts", instance.contact_id, str(instance))
+    queue_lookup("initiative_contacts", instance.contact_id, str(instance), load_lookup)
 
 
 @receiver(pre_delete, sender=CollectionMilestoneFrequency)
@@ -125,8 +132,11 @@ def deleted_collection_milestone_frequency(sender, instance, **kwargs):
 @receiver(post_save, sender=CollectionMilestoneFrequency)
 def updated_collection_milestone_frequency(sender, instance, **kwargs):
     """When collection_milestone_frequency is updated, add it to search."""
-    load_lookup.delay(
-        "collection_milestone_frequency", instance.frequency_id, str(instance)
+    queue_lookup(
+        "collection_milestone_frequency",
+        instance.frequency_id,
+        str(instance),
+        load_lookup,
     )
 
 
@@ -139,8 +149,11 @@ def deleted_collection_milestone_templates(sender, instance, **kwargs):
 @receiver(post_save, sender=CollectionMilestoneTemplates)
 def updated_collection_milestone_templates(sender, instance, **kwargs):
     """When collection_milestone_templates is updated, add it to search."""
-    load_lookup.delay(
-        "collection_milestone_templates", instance.template_id, str(instance)
+    queue_lookup(
+        "collection_milestone_templates",
+        instance.template_id,
+        str(instance),
+        load_lookup,
     )
 
 
@@ -153,7 +166,7 @@ def deleted_user_roles(sender, instance, **kwargs):
 @receiver(post_save, sender=UserRoles)
 def updated_user_roles(sender, instance, **kwargs):
     """When user_roles is updated, add it to search."""
-    load_lookup.delay("user_roles", instance.role_id, str(instance))
+    queue_lookup("user_roles", instance.role_id, str(instance), load_lookup)
 
 
 @receiver(pre_delete, sender=StrategicImportance)
@@ -165,27 +178,37 @@ def deleted_strategic_importance(sender, instance, **kwargs):
 @receiver(post_save, sender=StrategicImportance)
 def updated_strategic_importance(sender, instance, **kwargs):
     """When strategic_importance is updated, add it to search."""
-    load_lookup.delay("strategic_importance", instance.importance_id, str(instance))
+    queue_lookup(
+        "strategic_importance", instance.importance_id, str(instance), load_lookup
+    )
 
 
 @shared_task
 def delete_lookup(item_type, item_id, **kwargs):
     """Celery task to remove a initiative from search."""
-    solr = pysolr.Solr(settings.SOLR_LOOKUP_URL, always_commit=True)
+    solr = get_solr(settings.SOLR_LOOKUP_URL)
 
     solr.delete(
         q="id:%s_%s"
         % (
             item_type,
             str(item_id),
-        )
+        ),
+        **realtime_commit(delete=True),
     )
 
+    bump_generation("lookups")
+
 
 @shared_task
 def load_lookup(item_type, item_id, item_name):
     """Celery task to reload a lookup in search."""
-    solr = pysolr.Solr(settings.SOLR_LOOKUP_URL, always_commit=True)
+    load_lookups([(item_type, item_id, item_name)])
+
+
+def load_lookups(lookups):
+    """Reload (item_type, item_id, item_name) lookups in search."""
+    solr = get_solr(settings.SOLR_LOOKUP_URL)
     solr.add(
         [
             {
@@ -198,16 +221,22 @@ def load_lookup(item_type, item_id, item_name):
                 "item_name": item_name,
                 "atlas_id": item_id,
             }
-        ]
+            for item_type, item_id, item_name in lookups
+        ],
+        **realtime_commit(),
     )
 
+    bump_realtime("lookups")
+
 
 @shared_task
 def reset_lookups():
-    """Reset all lookups."""
-    solr = pysolr.Solr(settings.SOLR_LOOKUP_URL, always_commit=True)
+    """Reset all lookups.
+
+    The lookups are replaced in one commit.
+    """
+    solr = get_solr(settings.SOLR_LOOKUP_URL)
     solr.delete(q="*:*")
-    solr.optimize()
 
     docs = [
         {
@@ -341,3 +370,6 @@ def reset_lookups():
     )
 
     solr.add(docs)
+    bulk_commit(settings.SOLR_LOOKUP_URL)
+
+    bump_generation("lookups")
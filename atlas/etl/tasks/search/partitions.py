@@ -0,0 +1,202 @@
+"""Celery tasks to load a search type in parallel.
+
+The primary key range of a type is split into partitions which are loaded
+by a group of tasks across the ETL workers. The partitions overwrite the
+docs in place and do not commit; a chord callback removes the docs whose
+row is gone, commits once when all of them are done and records the load
+throughput. Searches keep finding the old docs until that commit.
+
+The state of the running load of each type is kept in the cache, so the
+ETL panel can show when it finishes or fails, and the delta load can wait
+for it instead of committing a partly loaded type.
+"""
+import importlib
+import logging
+import time
+from datetime import datetime
+
+import pytz
+from celery import chord, shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from etl.tasks.functions import (
+    bulk_commit,
+    delete_missing,
+    forget_all_docs,
+    forget_on_failure,
+    set_watermark,
+)
+from index.models import Collections, Initiatives, Reports, Terms, Users
+from search import collection_ads, typeahead
+from search.cache import bump_generation
+from search.warming import warm_searches
+
+logger = logging.getLogger(__name__)
+
+
+def partition_queryset(search_type):
+    """Get the rows of a type and their primary key name."""
+    if search_type == "reports":
+        return Reports.objects, "report_id"
+
+    if search_type == "terms":
+        return Terms.objects, "term_id"
+
+    if search_type == "collections":
+        return (
+            Collections.objects.filter(~Q(hidden="Y") | Q(hidden=None)),
+            "collection_id",
+        )
+
+    if search_type == "initiatives":
+        return Initiatives.objects, "initiative_id"
+
+    return Users.objects, "user_id"
+
+
+def build_partitions(search_type, count):
+    """Split the primary key range of a type in ``count`` [start, end) ranges."""
+    queryset, key = partition_queryset(search_type)
+    bounds = queryset.aggregate(low=Min(key), high=Max(key))
+
+    if bounds["low"] is None:
+        return []
+
+    size = -(-(bounds["high"] - bounds["low"] + 1) // count)
+
+    return [
+        (start, start + size)
+        for start in range(bounds["low"], bounds["high"] + 1, size)
+    ]
+
+
+def set_load_status(search_type, status, started):
+    """Record the state of the load of a type."""
+    cache.set(
+        "search:load:%s" % search_type,
+        {
+            "status": status,
+            "started": started,
+            "date_done": None if status == "STARTED" else timezone.now(),
+        },
+        timeout=None,
+    )
+
+
+def load_status(search_type):
+    """Get the state of the last load of a type, or None."""
+    return cache.get("search:load:%s" % search_type)
+
+
+def reset_running(search_type):
+    """Check if a load of the type was started and has not finished yet."""
+    status = load_status(search_type)
+
+    return (
+        status is not None
+        and status["status"] == "STARTED"
+        and time.time() - status["started"] < settings.SEARCH_RESET_TIMEOUT
+    )
+
+
+def partitioned_load(search_type, started):
+    """Load a type in parallel, then finish the reset in a callback.
+
+    ``started`` is the time the reset started, as a timestamp.
+    """
+    set_load_status(search_type, "STARTED", started)
+
+    try:
+        partitions = build_partitions(search_type, settings.SEARCH_ETL_PARTITIONS)
+
+        return chord(
+            load_partition.s(search_type, start, end) for start, end in partitions
+        )(
+            finish_load.s(search_type, started).on_error(
+                fail_load.s(search_type, started)
+            )
+        )
+
+    except Exception:
+        set_load_status(search_type, "FAILURE", started)
+        raise
+
+
+@shared_task
+def load_partition(search_type, start, end, url=None):
+    """Load the docs of a type with a primary key in [start, end).
+
+    Every doc is sent, as the whole type is reloaded. ``url`` is the core to
+    load, by default the live one. Returns the number sent.
+    """
+    module = importlib.import_module("etl.tasks.search.%s" % search_type)
+
+    return getattr(module, "load_%s" % search_type)(
+        id_range=(start, end), url=url, commit=False, skip=False
+    )["sent"]
+
+
+@shared_task
+def finish_load(counts, search_type, started):
+    """Remove the deleted docs, commit a partitioned load and reset the caches.
+
+    Returns the load throughput, which is kept in the task history.
+    """
+    try:
+        with forget_on_failure():
+            stats = commit_load(counts, search_type, started)
+
+    except Exception:
+        set_load_status(search_type, "FAILURE", started)
+        raise
+
+    set_load_status(search_type, "SUCCESS", started)
+
+    warm_searches()
+
+    return stats
+
+
+@shared_task
+def fail_load(request, exc, traceback, search_type, started):
+    """Record a failed partition of a load, as the chord callback never runs."""
+    logger.error("Search load of %s failed: %s", search_type, exc)
+
+    # the loaded partitions recorded the hashes of docs never committed.
+    forget_all_docs()
+
+    set_load_status(search_type, "FAILURE", started)
+
+
+def commit_load(counts, search_type, started):
+    """Remove the docs whose row is gone and commit the load."""
+    queryset, key = partition_queryset(search_type)
+    removed = delete_missing(search_type, queryset.values_list(key, flat=True))
+
+    commits = bulk_commit()
+
+    bump_generation(search_type)
+
+    if search_type == "collections":
+        collection_ads.reset_collection_ads()
+
+    if search_type != "initiatives":
+        typeahead.reset_typeahead(search_type)
+
+    set_watermark(search_type, datetime.fromtimestamp(started, tz=pytz.utc))
+
+    seconds = time.time() - started
+    stats = {
+        "type": search_type,
+        "partitions": len(counts),
+        "docs": sum(counts),
+        "removed": len(removed),
+        "commits": commits,
+        "seconds": round(seconds, 1),
+        "docs_per_second": round(sum(counts) / seconds, 1) if seconds else None,
+    }
+    logger.info("Search load finished: %s", stats)
+
+    return stats
@@ -0,0 +1,172 @@
+"""Celery tasks to rebuild search in a shadow core.
+
+A full rebuild loads every type into an empty shadow core while the live
+core keeps serving searches. When the doc counts match the database the
+cores are swapped, and the previous index stays in the shadow core until
+the next rebuild so it can be swapped back.
+"""
+import logging
+import time
+from datetime import datetime
+
+import pytz
+from celery import chord, shared_task
+from django.conf import settings
+from django.db.models import Q
+from etl.tasks.functions import (
+    count_commit,
+    forget_all_docs,
+    set_watermark,
+    swap_watermarks,
+)
+from etl.tasks.search.partitions import (
+    build_partitions,
+    load_partition,
+    set_load_status,
+)
+from index.models import Collections, Initiatives, Reports, Terms, Users
+from search import collection_ads, typeahead
+from search.cache import SEARCH_TYPES, bump_generation
+from search.solr import core_admin, core_name, get_solr
+from search.warming import warm_searches
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def rebuild_search():
+    """Rebuild search in the shadow core and swap it in.
+
+    1. Empty the shadow core
+    2. Load all types to the shadow core, in partitions across the workers
+    3. Check the doc count of each type against the database
+    4. Swap the shadow and live cores
+    5. Warm the search caches.
+
+    Steps 3-5 run in a chord callback once every partition is loaded, so no
+    task runs for the whole rebuild. The load is committed once, when it is
+    done. Edits made during the rebuild only reach the old core. The
+    watermarks are set to the start of the rebuild so the next delta ETL
+    reloads them.
+    """
+    started = time.time()
+    set_load_status("rebuild", "STARTED", started)
+
+    try:
+        get_solr(settings.SOLR_SHADOW_URL).delete(q="*:*")
+
+        partitions = [
+            load_partition.s(search_type, start, end, settings.SOLR_SHADOW_URL)
+            for search_type in SEARCH_TYPES
+            for start, end in build_partitions(
+                search_type, settings.SEARCH_ETL_PARTITIONS
+            )
+        ]
+
+        return chord(partitions)(
+            finish_rebuild.s(started).on_error(fail_rebuild.s(started))
+        )
+
+    except Exception:
+        set_load_status("rebuild", "FAILURE", started)
+        raise
+
+
+@shared_task
+def finish_rebuild(counts, started):
+    """Commit and check the shadow core, then swap it in.
+
+    Returns the number of partitions and docs loaded.
+    """
+    try:
+        # optimizing also hard commits the load.
+        get_solr(settings.SOLR_SHADOW_URL).optimize()
+        count_commit("hard")
+
+        check_counts(settings.SOLR_SHADOW_URL)
+
+        swap_cores()
+
+        for search_type in SEARCH_TYPES:
+            set_watermark(search_type, datetime.fromtimestamp(started, tz=pytz.utc))
+
+    except Exception:
+        set_load_status("rebuild", "FAILURE", started)
+        raise
+
+    set_load_status("rebuild", "SUCCESS", started)
+
+    warm_searches()
+
+    return {"commits": 1, "partitions": len(counts), "docs": sum(counts)}
+
+
+@shared_task
+def fail_rebuild(request, exc, traceback, started):
+    """Record a failed partition of a rebuild, as the swap never runs."""
+    logger.error("Search rebuild failed: %s", exc)
+
+    set_load_status("rebuild", "FAILURE", started)
+
+
+@shared_task
+def rollback_search():
+    """Swap the previous index back in.
+
+    The watermarks of the previous index come back with it, so the next
+    delta ETL reloads what changed since that index was last loaded.
+    """
+    swap_cores()
+
+
+def swap_cores():
+    """Swap the live and shadow cores, and reset everything cached."""
+    core_admin(
+        "SWAP",
+        core=core_name(settings.SOLR_URL),
+        other=core_name(settings.SOLR_SHADOW_URL),
+    )
+
+    swap_watermarks(SEARCH_TYPES)
+
+    for search_type in SEARCH_TYPES:
+        bump_generation(search_type)
+
+    forget_all_docs()
+
+    collection_ads.reset_collection_ads()
+
+    for index_type in ["reports", "terms", "collections", "users"]:
+        typeahead.reset_typeahead(index_type)
+
+
+def check_counts(url):
+    """Check that a core has a doc for every row of each type.
+
+    Raises ``ValueError`` listing the types that do not match.
+    """
+    solr = get_solr(url)
+
+    expected = {
+        "reports": Reports.objects.count(),
+        "terms": Terms.objects.count(),
+        "collections": Collections.objects.filter(
+            ~Q(hidden="Y") | Q(hidden=None)
+        ).count(),
+        "initiatives": Initiatives.objects.count(),
+        "users": Users.objects.count(),
+    }
+
+    found = {
+        search_type: solr.search("type:%s" % search_type, rows=0).hits
+        for search_type in expected
+    }
+
+    mismatches = [
+        "%s: %s in solr, %s in database" % (search_type, found[search_type], count)
+        for search_type, count in expected.items()
+        if found[search_type] != count
+    ]
+
+    if mismatches:
+        raise ValueError("Search rebuild is incomplete. %s" % "; ".join(mismatches))
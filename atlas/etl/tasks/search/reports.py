@@ -1,28 +1,91 @@
 """Celery tasks to keep report search up to date."""
 import contextlib
+import itertools
+import math
+import time
+import tracemalloc
 
 import pysolr
 from celery import shared_task
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django_chunked_iterator import batch_iterator
-from etl.tasks.functions import clean_doc, solr_date
-from index.models import Reports
+from etl.tasks.functions import (
+    add_changed,
+    bulk_commit,
+    bump_realtime,
+    clean_doc,
+    delete_missing,
+    forget_docs,
+    is_version_conflict,
+    realtime_commit,
+    solr_date,
+    update_fields,
+)
+from etl.tasks.search.buffer import queue_load
+from etl.tasks.search.partitions import partitioned_load
+from etl.tasks.search.suppress import suppressed
+from index.models import (
+    CollectionReports,
+    ReportFragilityTags,
+    Reportobjectweightedrunrank,
+    ReportQueries,
+    Reports,
+    ReportTerms,
+    Users,
+)
+from search import typeahead
+from search.cache import bump_generation
+from search.solr import get_solr
 
 
 @receiver(post_save, sender=Reports)
 def updated_report(sender, instance, **kwargs):
     """When report is updated, add it to search."""
-    load_report.delay(instance.report_id)
+    if suppressed("reports", instance.report_id):
+        return
+
+    typeahead.publish_change(
+        "reports",
+        instance.report_id,
+        str(instance) if instance.visible == "Y" and instance.orphan != "Y" else None,
+    )
+    queue_load("reports", instance.report_id, load_report)
+
+
+@receiver(post_save, sender=CollectionReports)
+@receiver(post_delete, sender=CollectionReports)
+def updated_report_collection(sender, instance, **kwargs):
+    """When a report is added to or removed from a collection, update its links."""
+    if instance.report_id is None or suppressed("reports", instance.report_id):
+        return
+
+    queue_load("report_links", instance.report_id, update_report_links)
+
+
+@receiver(post_save, sender=ReportTerms)
+@receiver(post_delete, sender=ReportTerms)
+def updated_report_term(sender, instance, **kwargs):
+    """When a term is added to or removed from a report, update its links."""
+    if instance.report_doc_id is None or suppressed("reports", instance.report_doc_id):
+        return
+
+    queue_load("report_links", instance.report_doc_id, update_report_links)
 
 
 @shared_task
 def delete_report(report_id):
     """Celery task to remove a report from search."""
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    solr = get_solr()
 
-    solr.delete(q="type:reports AND atlas_id:%s" % report_id)
+    solr.delete(
+        q="type:reports AND atlas_id:%s" % report_id, **realtime_commit(delete=True)
+    )
+    forget_docs(["/reports/%s" % report_id])
+
+    bump_generation("reports")
 
 
 @shared_task
@@ -31,30 +94,262 @@ def load_report(report_id):
     load_reports(report_id)
 
 
+@shared_task
+def update_report_links(report_id=None, ids=None):
+    """Celery task to update the linked terms and collections of reports.
+
+    Only the link fields are rebuilt, and sent as atomic updates. If a report
+    is not in search yet the reports are loaded in full. Returns the number
+    of docs sent.
+    """
+    reports = Reports.objects.prefetch_related(
+        "docs__terms__term", "collections__collection__initiative"
+    )
+
+    if report_id:
+        reports = reports.filter(report_id=report_id)
+
+    if ids is not None:
+        reports = reports.filter(report_id__in=ids)
+
+    docs = [build_link_doc(report) for report in reports]
+
+    if not docs:
+        return 0
+
+    try:
+        count = update_fields(get_solr(), docs, {field: "set" for field in LINK_FIELDS})
+    except pysolr.SolrError:
+        return load_reports(report_id, ids=ids)["sent"]
+
+    bump_realtime("reports")
+
+    return count
+
+
 @shared_task
 def reset_reports():
     """Reset report group in solr.
 
-    1. Delete all reports from Solr
-    2. Query all existing reports
-    3. Load data to solr.
+    1. Load data to solr in partitions across the ETL workers
+    2. Remove the reports that are no longer in the database
+    3. Commit once, reset the search caches and warm them.
+    """
+    started = time.time()
+
+    partitioned_load("reports", started)
+
+
+@shared_task
+def load_run_ranks():
+    """Update report run ranks in solr without reindexing the reports.
+
+    The ranks in solr are read with a cursor, and only the ones that differ
+    from the database are sent, as in-place updates of the "runs" docValues
+    field, and committed once. Reports that are not in solr yet get their
+    rank when they are loaded. Returns the number of ranks updated and of
+    commits made.
+    """
+    solr = get_solr()
+
+    ranks = dict(
+        Reportobjectweightedrunrank.objects.values_list(
+            "reportobjectid", "weighted_run_rank"
+        )
+    )
+
+    # "_version_" 1 keeps solr from adding a stub doc for a removed report.
+    changed = (
+        {
+            "id": "/reports/%s" % report_id,
+            "runs": float(ranks.get(report_id) or 0),
+            "_version_": 1,
+        }
+        for report_id, runs in indexed_run_ranks(solr)
+        if not math.isclose(runs, float(ranks.get(report_id) or 0), rel_tol=1e-6)
+    )
+
+    count = 0
+
+    while True:
+        batch = list(itertools.islice(changed, 1000))
+
+        if not batch:
+            break
+
+        count += set_run_ranks(solr, batch)
+
+    commits = 0
+
+    if count:
+        commits = bulk_commit()
+        bump_generation("reports")
+
+    return {"ranks": count, "commits": commits}
+
+
+def indexed_run_ranks(solr):
+    """Stream the (report id, run rank) of the reports in solr."""
+    cursor = "*"
+
+    while True:
+        results = solr.search(
+            "type:reports",
+            fl="atlas_id,runs",
+            sort="id asc",
+            rows=10000,
+            cursorMark=cursor,
+        )
+
+        for doc in results.docs:
+            yield doc["atlas_id"][0], doc.get("runs", 0.0)
+
+        if results.nextCursorMark in [None, cursor]:
+            return
+
+        cursor = results.nextCursorMark
+
+
+def set_run_ranks(solr, docs):
+    """Send in-place run rank updates. Returns the number of ranks updated.
+
+    Reports removed from solr since their rank was read are skipped.
+    """
+    try:
+        solr.add(docs, fieldUpdates={"runs": "set"})
+        return len(docs)
+    except pysolr.SolrError as e:
+        if not is_version_conflict(e):
+            raise
+
+    # a report in the batch is gone. update the others one at a time.
+    count = 0
+
+    for doc in docs:
+        try:
+            solr.add([doc], fieldUpdates={"runs": "set"})
+            count += 1
+        except pysolr.SolrError as e:
+            if not is_version_conflict(e):
+                raise
+
+    return count
+
+
+def delta_reports(since):
+    """Reload reports changed since a time and remove deleted reports.
+
+    The changes are left for the caller to commit. Returns a ``Counter`` of
+    docs sent and skipped.
     """
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    counts = load_reports(changed_since=since, commit=False)
 
-    solr.delete(q="type:reports")
-    solr.optimize()
+    delete_missing("reports", Reports.objects.values_list("report_id", flat=True))
 
-    load_reports()
+    typeahead.reset_typeahead("reports")
 
+    return counts
 
-def load_reports(report_id=None):
+
+def changed_reports(since):
+    """Filter reports whose search doc may have changed since a time."""
+    return (
+        Q(_modified_at__gt=since)
+        | Q(etl_date__gt=since)
+        | Q(docs___modified_at__gt=since)
+        | Q(docs__terms__term___modified_at__gt=since)
+        | Q(collections__collection___modified_at__gt=since)
+        | Q(collections__collection__initiative___modified_at__gt=since)
+    )
+
+
+def load_reports(
+    report_id=None,
+    changed_since=None,
+    id_range=None,
+    ids=None,
+    url=None,
+    commit=True,
+    skip=True,
+):
     """Load a group of reports to solr database.
 
     1. Convert the objects to list of dicts
     2. Bulk load to solr in batchs of x
+
+    With ``skip`` docs that did not change since they were last sent are not
+    sent again. Returns a ``Counter`` of docs sent and skipped.
+    """
+    reports = Reports.objects.all()
+
+    if report_id:
+        reports = reports.filter(report_id=report_id)
+
+    if id_range:
+        reports = reports.filter(report_id__gte=id_range[0], report_id__lt=id_range[1])
+
+    if ids is not None:
+        reports = reports.filter(report_id__in=ids)
+
+    if changed_since:
+        reports = reports.filter(
+            report_id__in=Reports.objects.filter(changed_reports(changed_since)).values(
+                "report_id"
+            )
+        )
+
+    # rows are read in batches of "batch_size" and streamed to solr.
+    count = solr_load_batch(
+        itertools.chain.from_iterable(build_doc_batches(reports)),
+        url=url,
+        commit=commit,
+        skip=skip,
+    )
+
+    # bulk loads invalidate the cached searches once they commit.
+    if commit and count["sent"]:
+        bump_realtime("reports")
+
+    return count
+
+
+def build_doc_batches(reports, source=None):
+    """Build the docs of a queryset of reports in batches of 1000.
+
+    ``source`` is "orm" or "flat", and defaults to ``SEARCH_REPORT_SOURCE``.
     """
-    reports = (
-        Reports.objects.select_related("created_by")
+    if (source or settings.SEARCH_REPORT_SOURCE) == "flat":
+        for batch in batch_iterator(
+            reports.values("report_id"), batch_size=1000, order_by="report_id"
+        ):
+            yield build_flat_docs([row["report_id"] for row in batch])
+        return
+
+    for batch in batch_iterator(with_relations(reports), batch_size=1000):
+        yield map(build_doc, batch)
+
+
+def solr_load_batch(batch, url=None, commit=True, skip=True):
+    """Process docs, which can be a generator.
+
+    Without ``commit`` the docs are left for the caller to commit.
+    """
+    return add_changed(get_solr(url), batch, commit=commit, skip=skip)
+
+
+def run_rank():
+    """Annotate the weighted run rank of a report."""
+    return Subquery(
+        Reportobjectweightedrunrank.objects.filter(
+            reportobjectid=OuterRef("report_id")
+        ).values("weighted_run_rank")[:1]
+    )
+
+
+def with_relations(reports):
+    """Fetch everything the orm doc source reads with the reports."""
+    return (
+        reports.select_related("created_by")
         .select_related("modified_by")
         .select_related("type")
         .prefetch_related("docs")
@@ -68,27 +363,13 @@ def load_reports(report_id=None):
         .prefetch_related("docs__modified_by")
         .prefetch_related("queries")
         .prefetch_related("docs__fragility_tags")
-        .prefetch_related("docs__fragility_tags")
         .prefetch_related("docs__terms")
         .prefetch_related("collections")
         .prefetch_related("collections__collection")
         .prefetch_related("collections__collection__initiative")
+        .annotate(run_rank=run_rank())
     )
 
-    if report_id:
-        reports = reports.filter(report_id=report_id)
-
-    # reset the batch. reports will be loaded to solr in batches
-    # of "batch_size"
-    list(map(solr_load_batch, batch_iterator(reports.all(), batch_size=1000)))
-
-
-def solr_load_batch(batch):
-    """Process batch."""
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
-
-    solr.add(list(map(build_doc, batch)))
-
 
 def build_doc(report):
     """Build a report doc."""
@@ -113,7 +394,7 @@ def build_doc(report):
         "epic_record_id": report.system_id,
         "visible": report.visible,
         "orphan": report.orphan or "N",
-        "runs": 10,
+        "runs": float(report.run_rank or 0),
         "epic_template": report.system_template_id,
         "last_load_date": solr_date(report.etl_date),
         "query": [query.query for query in report.queries.all()],
@@ -130,9 +411,28 @@ def build_doc(report):
     for collection_link in report.collections.all():
         doc = build_report_collection_docs(collection_link, doc)
 
+    doc["quality_score"] = build_quality_score(doc)
+
     return clean_doc(doc)
 
 
+def build_quality_score(doc):
+    """Score how trustworthy a report is.
+
+    Search multiplies the relevance of a report by this score. It starts at
+    1 and goes up by 1 for each of documented, executive visibility,
+    enabled for hyperspace and analytics certified.
+    """
+    return 1.0 + sum(
+        [
+            doc.get("documented") == "1",
+            doc.get("executive_visibility") == "Y",
+            doc.get("enabled_for_hyperspace") == "Y",
+            doc.get("certification") == "Analytics Certified",
+        ]
+    )
+
+
 def build_report_doc(report, doc):
     """Build doc from report docs."""
     doc["description"].extend([report.docs.description, report.docs.assumptions])
@@ -155,10 +455,17 @@ def build_report_doc(report, doc):
     )
 
     for term_link in report.docs.terms.all():
-        doc["related_terms"].append(str(term_link.term))
-        doc["linked_description"].extend(
-            [term_link.term.summary, term_link.term.technical_definition]
-        )
+        doc = build_report_term_docs(term_link, doc)
+
+    return doc
+
+
+def build_report_term_docs(term_link, doc):
+    """Build report term docs."""
+    doc["related_terms"].append(str(term_link.term))
+    doc["linked_description"].extend(
+        [term_link.term.summary, term_link.term.technical_definition]
+    )
 
     return doc
 
@@ -180,3 +487,274 @@ def build_report_collection_docs(collection_link, doc):
         )
 
     return doc
+
+
+# report doc fields built from the report's term and collection links.
+LINK_FIELDS = [
+    "related_terms",
+    "linked_description",
+    "related_collections",
+    "related_initiatives",
+]
+
+
+def build_link_doc(report):
+    """Build the link fields of a report doc, for an atomic update.
+
+    Fields with no links are sent empty, which removes them from the doc.
+    """
+    doc = {"id": "/reports/%s" % report.report_id, **{f: [] for f in LINK_FIELDS}}
+
+    with contextlib.suppress(AttributeError):
+        for term_link in report.docs.terms.all():
+            doc = build_report_term_docs(term_link, doc)
+
+    for collection_link in report.collections.all():
+        doc = build_report_collection_docs(collection_link, doc)
+
+    return {**doc, **clean_doc(doc)}
+
+
+# report fields read by the flat doc source. lookups and the report docs are
+# joined in; users are named in python.
+FLAT_FIELDS = [
+    "report_id",
+    "name",
+    "title",
+    "description",
+    "detailed_description",
+    "system_description",
+    "system_server",
+    "system_db",
+    "certification_tag",
+    "type__short_name",
+    "type__name",
+    "created_by",
+    "modified_by",
+    "_modified_at",
+    "system_identifier",
+    "system_id",
+    "visible",
+    "orphan",
+    "run_rank",
+    "system_template_id",
+    "etl_date",
+    "docs__report",
+    "docs__description",
+    "docs__assumptions",
+    "docs__ops_owner",
+    "docs__requester",
+    "docs___created_at",
+    "docs__org_value__name",
+    "docs__frequency__name",
+    "docs__fragility__name",
+    "docs__executive_report",
+    "docs__maintenance_schedule__name",
+    "docs___modified_at",
+    "docs__created_by",
+    "docs__modified_by",
+    "docs__enabled_for_hyperspace",
+    "docs__do_not_purge",
+]
+
+FLAT_USERS = [
+    "created_by",
+    "modified_by",
+    "docs__ops_owner",
+    "docs__requester",
+    "docs__created_by",
+    "docs__modified_by",
+]
+
+
+def group_rows(rows):
+    """Group (report_id, *values) rows by report id."""
+    groups: dict = {}
+    for report_id, *values in rows:
+        groups.setdefault(report_id, []).append(values)
+
+    return groups
+
+
+def build_flat_docs(report_ids):
+    """Build report docs from plain rows instead of model instances.
+
+    One query reads the reports with their docs and lookups, and one query
+    per list field reads it for all the reports. The docs match the docs of
+    ``build_doc``.
+    """
+    rows = list(
+        Reports.objects.filter(report_id__in=report_ids)
+        .annotate(run_rank=run_rank())
+        .values(*FLAT_FIELDS)
+    )
+
+    user_ids = {row[field] for row in rows for field in FLAT_USERS} - {None}
+    users = {
+        user.user_id: str(user) for user in Users.objects.filter(user_id__in=user_ids)
+    }
+
+    queries = group_rows(
+        ReportQueries.objects.filter(report_id__in=report_ids).values_list(
+            "report_id", "query"
+        )
+    )
+    tags = group_rows(
+        ReportFragilityTags.objects.filter(report__in=report_ids).values_list(
+            "report", "fragility_tag__name"
+        )
+    )
+    terms = group_rows(
+        ReportTerms.objects.filter(report_doc__in=report_ids).values_list(
+            "report_doc", "term__name", "term__summary", "term__technical_definition"
+        )
+    )
+    collections = group_rows(
+        CollectionReports.objects.filter(report__in=report_ids).values_list(
+            "report",
+            "collection__name",
+            "collection__description",
+            "collection__search_summary",
+            "collection__initiative",
+            "collection__initiative__name",
+            "collection__initiative__description",
+        )
+    )
+
+    return [
+        build_flat_doc(
+            row,
+            users,
+            queries.get(row["report_id"], []),
+            tags.get(row["report_id"], []),
+            terms.get(row["report_id"], []),
+            collections.get(row["report_id"], []),
+        )
+        for row in rows
+    ]
+
+
+def build_flat_doc(row, users, queries, tags, terms, collections):
+    """Build a report doc from a flat report row and its list rows."""
+    doc = {
+        "id": "/reports/%s" % row["report_id"],
+        "atlas_id": row["report_id"],
+        "type": "reports",
+        "source_server": row["system_server"],
+        "source_database": row["system_db"],
+        "name": row["title"] or row["name"],
+        "description": [
+            row["description"],
+            row["detailed_description"],
+            row["system_description"],
+        ],
+        "certification": row["certification_tag"],
+        "report_type": row["type__short_name"] or row["type__name"],
+        "author": users.get(row["created_by"]),
+        "report_last_updated_by": users.get(row["modified_by"]),
+        "report_last_updated": solr_date(row["_modified_at"]),
+        "epic_master_file": row["system_identifier"],
+        "epic_record_id": row["system_id"],
+        "visible": row["visible"],
+        "orphan": row["orphan"] or "N",
+        "runs": float(row["run_rank"] or 0),
+        "epic_template": row["system_template_id"],
+        "last_load_date": solr_date(row["etl_date"]),
+        "query": [query for (query,) in queries],
+        "fragility_tags": [tag for (tag,) in tags],
+        "related_terms": [],
+        "linked_description": [],
+        "related_collections": [],
+        "related_initiatives": [],
+    }
+
+    if row["docs__report"] is not None:
+        doc["description"].extend([row["docs__description"], row["docs__assumptions"]])
+        doc["operations_owner"] = users.get(row["docs__ops_owner"])
+        doc["requester"] = users.get(row["docs__requester"])
+        doc["created"] = solr_date(row["docs___created_at"])
+        doc["organizational_value"] = row["docs__org_value__name"]
+        doc["estimated_run_frequency"] = row["docs__frequency__name"]
+        doc["fragility"] = row["docs__fragility__name"]
+        doc["executive_visibility"] = row["docs__executive_report"] or "N"
+        doc["maintenance_schedule"] = row["docs__maintenance_schedule__name"]
+        doc["last_updated"] = solr_date(row["docs___modified_at"])
+        doc["created_by"] = users.get(row["docs__created_by"])
+        doc["updated_by"] = users.get(row["docs__modified_by"])
+        doc["enabled_for_hyperspace"] = row["docs__enabled_for_hyperspace"]
+        doc["do_not_purge"] = row["docs__do_not_purge"]
+        doc["documented"] = "1"
+
+        for name, summary, technical_definition in terms:
+            doc["related_terms"].append(name)
+            doc["linked_description"].extend([summary, technical_definition])
+
+    for (
+        name,
+        description,
+        search_summary,
+        initiative,
+        initiative_name,
+        initiative_description,
+    ) in collections:
+        doc["related_collections"].append(name)
+        doc["linked_description"].extend([description, search_summary])
+
+        if initiative is not None:
+            doc["related_initiatives"].append(initiative_name)
+            doc["linked_description"].append(initiative_description)
+
+    doc["quality_score"] = build_quality_score(doc)
+
+    return clean_doc(doc)
+
+
+@shared_task
+def benchmark_report_sources(count=5000):
+    """Compare the orm and flat report doc sources.
+
+    Builds the docs of the first ``count`` reports with each source, without
+    loading them to solr. Returns the docs/sec and peak python memory of
+    each source, and the number of docs that differ between them.
+    """
+    last_ids = Reports.objects.order_by("report_id").values_list(
+        "report_id", flat=True
+    )[:count]
+    reports = Reports.objects.filter(report_id__lte=max(last_ids, default=0))
+
+    stats = {}
+    docs = {}
+    for source in ["orm", "flat"]:
+        tracemalloc.start()
+        started = time.perf_counter()
+
+        docs[source] = [
+            doc for batch in build_doc_batches(reports, source) for doc in batch
+        ]
+
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        stats[source] = {
+            "docs": len(docs[source]),
+            "seconds": round(seconds, 2),
+            "docs_per_second": (
+                round(len(docs[source]) / seconds, 1) if seconds else None
+            ),
+            "peak_mb": round(peak / 1024 / 1024, 1),
+        }
+
+    def normalize(doc):
+        """Sort the list fields, which the sources may order differently."""
+        return {
+            key: sorted(map(str, value)) if isinstance(value, list) else value
+            for key, value in doc.items()
+        }
+
+    flat_docs = {doc["id"]: normalize(doc) for doc in docs["flat"]}
+    stats["mismatches"] = sum(
+        normalize(doc) != flat_docs.get(doc["id"]) for doc in docs["orm"]
+    )
+
+    return stats
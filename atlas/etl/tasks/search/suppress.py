@@ -0,0 +1,168 @@
+"""Bulk writes without the search signals.
+
+Saving many reports, terms, collections or initiatives fires the search
+signals for every row. Inside ``suppress_search_signals`` the signals only
+record the primary keys they were given, and when the block exits one task
+reloads exactly those objects and the docs that embed them, and removes the
+ones that were deleted.
+
+Usable as a context manager or decorator, in management commands and the
+upstream loaders::
+
+    with suppress_search_signals():
+        for report in reports:
+            report.save()
+
+Blocks can be nested; the outermost block reindexes. Inside a transaction
+the reindex waits for the commit, and is dropped by a rollback.
+"""
+import contextlib
+import importlib
+import itertools
+import threading
+
+from celery import shared_task
+from django.db import transaction
+from etl.tasks.functions import (
+    bulk_commit,
+    chunker,
+    forget_docs,
+    forget_on_failure,
+)
+from etl.tasks.search.dependencies import dependent_ids
+from etl.tasks.search.partitions import partition_queryset
+from search import collection_ads, typeahead
+from search.cache import bump_generation
+from search.solr import get_solr
+
+# ids are reloaded in chunks to keep the sql "in" list short.
+CHUNK_SIZE = 1000
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def suppress_search_signals():
+    """Suppress the search signals in a block and reindex once at the end."""
+    if getattr(_local, "touched", None) is not None:
+        yield
+        return
+
+    _local.touched = {}
+    _local.dependents = {}
+    try:
+        yield
+    finally:
+        touched = {
+            search_type: sorted(ids) for search_type, ids in _local.touched.items()
+        }
+        dependents = {
+            search_type: sorted(ids) for search_type, ids in _local.dependents.items()
+        }
+        _local.touched = None
+        _local.dependents = None
+
+        if touched or dependents:
+            transaction.on_commit(lambda: reindex_objects.delay(touched, dependents))
+
+
+def suppressed(search_type, atlas_id, deleted=False):
+    """Record an object if the search signals are suppressed.
+
+    The docs that embed a ``deleted`` object are looked up now, as its links
+    are deleted with it. Returns True when the signal should do nothing else.
+    """
+    touched = getattr(_local, "touched", None)
+
+    if touched is None:
+        return False
+
+    touched.setdefault(search_type, set()).add(atlas_id)
+
+    if deleted:
+        for dependent_type, ids in dependent_ids(search_type, [atlas_id]).items():
+            _local.dependents.setdefault(dependent_type, set()).update(ids)
+
+    return True
+
+
+@shared_task
+def reindex_objects(touched, dependents=None):
+    """Reload the objects touched in a ``suppress_search_signals`` block.
+
+    ``touched`` maps each search type to a list of ids. Ids that are no
+    longer in the database are removed from search. The names and visibility
+    of the objects may have changed, so the typeahead and collection ads are
+    reset for their types.
+
+    The docs that only embed a touched object, and the ``dependents`` of the
+    deleted ones, are reloaded in the same commit, without resetting anything
+    for them. Returns the number of objects reindexed by type.
+    """
+    dependents = [dependents or {}]
+    for search_type, ids in touched.items():
+        for chunk in chunker(ids, CHUNK_SIZE):
+            dependents.append(dependent_ids(search_type, chunk))
+
+    reloaded: dict = {}
+    for search_type, ids in itertools.chain(
+        touched.items(), *(dependent.items() for dependent in dependents)
+    ):
+        reloaded.setdefault(search_type, set()).update(ids)
+
+    reloaded = {search_type: sorted(ids) for search_type, ids in reloaded.items()}
+
+    with forget_on_failure():
+        reload_objects(reloaded)
+
+        bulk_commit()
+
+    for search_type in reloaded:
+        bump_generation(search_type)
+
+    for search_type in touched:
+        if search_type != "initiatives":
+            typeahead.reset_typeahead(search_type)
+
+    if "collections" in touched:
+        collection_ads.reset_collection_ads()
+
+    return {search_type: len(ids) for search_type, ids in reloaded.items()}
+
+
+@shared_task
+def reindex_dependents(dependents):
+    """Reload the docs that embed a changed object.
+
+    Only the embedded text of these docs changed, not their own names or
+    visibility, so the typeahead and collection ads are kept. Returns the
+    number of objects reindexed by type.
+    """
+    return reindex_objects({}, dependents)
+
+
+def reload_objects(touched):
+    """Reload objects by type and remove the ones that were deleted.
+
+    The docs are left for the caller to commit.
+    """
+    solr = get_solr()
+
+    for search_type, ids in touched.items():
+        module = importlib.import_module("etl.tasks.search.%s" % search_type)
+        queryset, key = partition_queryset(search_type)
+
+        for chunk in chunker(ids, CHUNK_SIZE):
+            getattr(module, "load_%s" % search_type)(ids=chunk, commit=False)
+
+            found = set(
+                queryset.filter(**{"%s__in" % key: chunk}).values_list(key, flat=True)
+            )
+            missing = [atlas_id for atlas_id in chunk if atlas_id not in found]
+
+            if missing:
+                solr.delete(
+                    q="type:%s AND atlas_id:(%s)"
+                    % (search_type, " OR ".join(str(atlas_id) for atlas_id in missing))
+                )
+                forget_docs("/%s/%s" % (search_type, atlas_id) for atlas_id in missing)
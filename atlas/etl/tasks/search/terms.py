@@ -1,34 +1,79 @@
 """Celery tasks to keep term search up to date."""
 import contextlib
+import itertools
+import time
 
-import pysolr
 from celery import shared_task
-from django.conf import settings
-from django.db.models.signals import post_save, pre_delete
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django_chunked_iterator import batch_iterator
-from etl.tasks.functions import clean_doc, solr_date
-from index.models import Terms
+from etl.tasks.functions import (
+    add_changed,
+    bump_realtime,
+    clean_doc,
+    delete_missing,
+    forget_docs,
+    realtime_commit,
+    solr_date,
+)
+from etl.tasks.search.buffer import queue_load
+from etl.tasks.search.dependencies import queue_dependents
+from etl.tasks.search.partitions import partitioned_load
+from etl.tasks.search.suppress import reindex_dependents, suppressed
+from index.models import CollectionTerms, ReportTerms, Terms
+from search import typeahead
+from search.cache import bump_generation
+from search.solr import get_solr
 
 
 @receiver(pre_delete, sender=Terms)
 def deleted_term(sender, instance, **kwargs):
     """When term is delete, remove it from search."""
+    if suppressed("terms", instance.term_id, deleted=True):
+        return
+
+    queue_dependents("terms", instance.term_id, reindex_dependents)
+
+    typeahead.publish_change("terms", instance.term_id)
     delete_term.delay(instance.term_id)
 
 
 @receiver(post_save, sender=Terms)
 def updated_term(sender, instance, **kwargs):
     """When term is updated, add it to search."""
-    load_term.delay(instance.term_id)
+    if suppressed("terms", instance.term_id):
+        return
+
+    queue_dependents("terms", instance.term_id, reindex_dependents)
+
+    typeahead.publish_change("terms", instance.term_id, str(instance))
+    queue_load("terms", instance.term_id, load_term)
+
+
+@receiver(post_save, sender=CollectionTerms)
+@receiver(post_delete, sender=CollectionTerms)
+@receiver(post_save, sender=ReportTerms)
+@receiver(post_delete, sender=ReportTerms)
+def updated_term_link(sender, instance, **kwargs):
+    """When a term is linked to or unlinked from an object, update it in search."""
+    if instance.term_id is None or suppressed("terms", instance.term_id):
+        return
+
+    queue_load("terms", instance.term_id, load_term)
 
 
 @shared_task
 def delete_term(term_id):
     """Celery task to remove a term from search."""
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    solr = get_solr()
 
-    solr.delete(q="type:terms AND atlas_id:%s" % term_id)
+    solr.delete(
+        q="type:terms AND atlas_id:%s" % term_id, **realtime_commit(delete=True)
+    )
+    forget_docs(["/terms/%s" % term_id])
+
+    bump_generation("terms")
 
 
 @shared_task
@@ -41,23 +86,58 @@ def load_term(term_id):
 def reset_terms():
     """Reset term group in solr.
 
-    1. Delete all terms from Solr
-    2. Query all existing terms
-    3. Load data to solr.
+    1. Load data to solr in partitions across the ETL workers
+    2. Remove the terms that are no longer in the database
+    3. Commit once, reset the search caches and warm them.
+    """
+    started = time.time()
+
+    partitioned_load("terms", started)
+
+
+def delta_terms(since):
+    """Reload terms changed since a time and remove deleted terms.
+
+    The changes are left for the caller to commit. Returns a ``Counter`` of
+    docs sent and skipped.
     """
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    counts = load_terms(changed_since=since, commit=False)
 
-    solr.delete(q="type:terms")
-    solr.optimize()
+    delete_missing("terms", Terms.objects.values_list("term_id", flat=True))
 
-    load_terms()
+    typeahead.reset_typeahead("terms")
 
+    return counts
 
-def load_terms(term_id=None):
+
+def changed_terms(since):
+    """Filter terms whose search doc may have changed since a time."""
+    return (
+        Q(_modified_at__gt=since)
+        | Q(report_docs__report_doc___modified_at__gt=since)
+        | Q(report_docs__report_doc__report___modified_at__gt=since)
+        | Q(report_docs__report_doc__report__etl_date__gt=since)
+        | Q(collections__collection___modified_at__gt=since)
+        | Q(collections__collection__initiative___modified_at__gt=since)
+    )
+
+
+def load_terms(
+    term_id=None,
+    changed_since=None,
+    id_range=None,
+    ids=None,
+    url=None,
+    commit=True,
+    skip=True,
+):
     """Load a group of terms to solr database.
 
     1. Convert the objects to list of dicts
     2. Bulk load to solr in batchs of x
+
+    With ``skip`` docs that did not change since they were last sent are not
+    sent again. Returns a ``Counter`` of docs sent and skipped.
     """
     terms = (
         Terms.objects.select_related("approved_by")
@@ -73,16 +153,40 @@ def load_terms(term_id=None):
     if term_id:
         terms = terms.filter(term_id=term_id)
 
-    # reset the batch. reports will be loaded to solr in batches
-    # of "batch_size"
-    list(map(solr_load_batch, batch_iterator(terms.all(), batch_size=1000)))
+    if id_range:
+        terms = terms.filter(term_id__gte=id_range[0], term_id__lt=id_range[1])
+
+    if ids is not None:
+        terms = terms.filter(term_id__in=ids)
+
+    if changed_since:
+        terms = terms.filter(
+            term_id__in=Terms.objects.filter(changed_terms(changed_since)).values(
+                "term_id"
+            )
+        )
+
+    # rows are read in batches of "batch_size" and streamed to solr.
+    count = solr_load_batch(
+        itertools.chain.from_iterable(batch_iterator(terms.all(), batch_size=1000)),
+        url=url,
+        commit=commit,
+        skip=skip,
+    )
 
+    # bulk loads invalidate the cached searches once they commit.
+    if commit and count["sent"]:
+        bump_realtime("terms")
 
-def solr_load_batch(batch):
-    """Process batch."""
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    return count
 
-    solr.add(list(map(build_doc, batch)))
+
+def solr_load_batch(batch, url=None, commit=True, skip=True):
+    """Process batch.
+
+    Without ``commit`` the docs are left for the caller to commit.
+    """
+    return add_changed(get_solr(url), map(build_doc, batch), commit=commit, skip=skip)
 
 
 def build_doc(term):
@@ -94,7 +198,6 @@ def build_doc(term):
         "name": str(term),
         "visible": "Y",
         "orphan": "N",
-        "runs": 10,
         "description": [term.summary, term.technical_definition],
         "approved": term.approved or "N",
         "approval_date": solr_date(term._approved_at),
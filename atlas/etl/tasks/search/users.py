@@ -1,14 +1,22 @@
 """Celery tasks to keep user search up to date."""
 # disable qa until fixing user reload.
 # flake8: noqa
-import pysolr
+import itertools
+import time
+
 from celery import shared_task
-from django.conf import settings
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django_chunked_iterator import batch_iterator
-from etl.tasks.functions import clean_doc
+from etl.tasks.functions import (
+    add_changed,
+    bump_realtime,
+    clean_doc,
+    forget_docs,
+    realtime_commit,
+)
+from etl.tasks.search.partitions import partitioned_load
 from index.models import Users
+from search.cache import bump_generation
+from search.solr import get_solr
 
 # this is somehow causing an endless loop when logging in?!
 # @receiver(post_save, sender=Users)
@@ -20,9 +28,14 @@ from index.models import Users
 @shared_task
 def delete_user(user_id):
     """Celery task to remove a user from search."""
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    solr = get_solr()
+
+    solr.delete(
+        q="type:users AND atlas_id:%s" % user_id, **realtime_commit(delete=True)
+    )
+    forget_docs(["/users/%s" % user_id])
 
-    solr.delete(q="type:users AND atlas_id:%s" % user_id)
+    bump_generation("users")
 
 
 @shared_task
@@ -35,39 +48,56 @@ def load_user(user_id):
 def reset_users():
     """Reset user group in solr.
 
-    1. Delete all users from Solr
-    2. Query all existing users
-    3. Load data to solr.
+    1. Load data to solr in partitions across the ETL workers
+    2. Remove the users that are no longer in the database
+    3. Commit once, reset the search caches and warm them.
     """
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
-
-    solr.delete(q="type:users")
-    solr.optimize()
+    started = time.time()
 
-    load_users()
+    partitioned_load("users", started)
 
 
-def load_users(user_id=None):
+def load_users(user_id=None, id_range=None, ids=None, url=None, commit=True, skip=True):
     """Load a group of users to solr database.
 
     1. Convert the objects to list of dicts
     2. Bulk load to solr in batchs of x
+
+    With ``skip`` docs that did not change since they were last sent are not
+    sent again. Returns a ``Counter`` of docs sent and skipped.
     """
     users = Users.objects
 
     if user_id:
         users = users.filter(user_id=user_id)
 
-    # reset the batch. reports will be loaded to solr in batches
-    # of "batch_size"
-    list(map(solr_load_batch, batch_iterator(users.all(), batch_size=1000)))
+    if id_range:
+        users = users.filter(user_id__gte=id_range[0], user_id__lt=id_range[1])
+
+    if ids is not None:
+        users = users.filter(user_id__in=ids)
 
+    # rows are read in batches of "batch_size" and streamed to solr.
+    count = solr_load_batch(
+        itertools.chain.from_iterable(batch_iterator(users.all(), batch_size=1000)),
+        url=url,
+        commit=commit,
+        skip=skip,
+    )
 
-def solr_load_batch(batch):
-    """Process batch."""
-    solr = pysolr.Solr(settings.SOLR_URL, always_commit=True)
+    # bulk loads invalidate the cached searches once they commit.
+    if commit and count["sent"]:
+        bump_realtime("users")
 
-    solr.add(list(map(build_doc, batch)))
+    return count
+
+
+def solr_load_batch(batch, url=None, commit=True, skip=True):
+    """Process batch.
+
+    Without ``commit`` the docs are left for the caller to commit.
+    """
+    return add_changed(get_solr(url), map(build_doc, batch), commit=commit, skip=skip)
 
 
 def build_doc(user):
@@ -83,7 +113,6 @@ def build_doc(user):
         "user_roles": [role[0] for role in user.get_roles()],
         "visible": "Y",
         "orphan": "N",
-        "runs": 10,
     }
 
     return clean_doc(doc)
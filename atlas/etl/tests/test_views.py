@@ -0,0 +1,455 @@
+"""Atlas ETL tests.
+
+Run test for this app with::
+
+    poetry run coverage erase; \
+    poetry run coverage run -p manage.py \
+        test etl/ --no-input --pattern="test_views.py" --settings atlas.settings.test; \
+    poetry run coverage combine; \
+    poetry run coverage report --include "etl*" -m
+
+"""
+import contextlib
+import json
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import pysolr
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from etl.tasks.functions import (
+    add_changed,
+    forget_on_failure,
+    get_watermark,
+    set_watermark,
+)
+from etl.tasks.search import buffer, delta, dependencies, partitions, suppress, terms
+from etl.tasks.search.consistency import diff_rows
+from etl.tasks.search.reports import build_doc_batches, load_reports, load_run_ranks
+from index.models import (
+    CollectionReports,
+    Collections,
+    CollectionTerms,
+    Initiatives,
+    ReportDocs,
+    ReportFragilityTags,
+    Reportobjectweightedrunrank,
+    ReportQueries,
+    Reports,
+    ReportTerms,
+    Terms,
+)
+from search.solr import get_solr
+
+from atlas.testutils import AtlasTestCase
+
+# pylint: disable=C0103,W0105,C0115
+
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class FakeRedis:
+    """Redis sets and hashes in memory, for the search buffer."""
+
+    def __init__(self):
+        self.keys = {}
+
+    def sadd(self, key, *values):
+        self.keys.setdefault(key, set()).update(str(value).encode() for value in values)
+
+    def smembers(self, key):
+        return set(self.keys.get(key, set()))
+
+    def hgetall(self, key):
+        return dict(self.keys.get(key, {}))
+
+    def delete(self, key):
+        self.keys.pop(key, None)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Commands of a fake redis pipeline, run when it is executed."""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, command):
+        return lambda *args: self.commands.append((command, args))
+
+    def execute(self):
+        return [getattr(self.client, command)(*args) for command, args in self.commands]
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class SearchEtlTestCase(AtlasTestCase):
+    def setUp(self):
+        """Catch the docs streamed to solr, by core url."""
+        super().setUp()
+        cache.clear()
+
+        self.posts = []
+
+        def post(url, data=None, **kwargs):
+            self.posts.append((url, [json.loads(line) for line in data]))
+            return mock.Mock(status_code=200)
+
+        patcher = mock.patch("requests.Session.post", side_effect=post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_stream_report_decimals(self):
+        """Check that report docs with decimal ids are streamed to solr."""
+        Reports.objects.filter(report_id=1).update(
+            system_id=Decimal("123456"), system_template_id=Decimal("42")
+        )
+
+        count = load_reports(ids=[1], skip=False)
+
+        self.assertEqual(count["sent"], 1)
+
+        doc = self.posts[0][1][0]
+        self.assertEqual(doc["id"], "/reports/1")
+        self.assertEqual(doc["epic_record_id"], "123456")
+        self.assertEqual(doc["epic_template"], "42")
+
+    @override_settings(SOLR_UPDATE_SIZE=2)
+    def test_add_changed(self):
+        """Check that only changed docs are sent, in requests of the update size."""
+        solr = get_solr()
+        docs = [{"id": "/terms/%s" % atlas_id, "name": "Term"} for atlas_id in range(5)]
+
+        self.assertEqual(add_changed(solr, docs), {"sent": 5, "skipped": 0})
+        self.assertEqual([len(sent) for _, sent in self.posts], [2, 2, 1])
+
+        docs[3]["name"] = "Renamed"
+        self.assertEqual(add_changed(solr, docs), {"sent": 1, "skipped": 4})
+        self.assertEqual(self.posts[-1][1], [docs[3]])
+
+        self.assertEqual(add_changed(solr, docs), {"sent": 0, "skipped": 5})
+        self.assertEqual(len(self.posts), 4)
+
+        self.assertEqual(add_changed(solr, docs, skip=False), {"sent": 5, "skipped": 0})
+
+        # loads into another core neither skip nor record hashes.
+        docs[0]["name"] = "Shadow"
+        shadow = get_solr(settings.SOLR_SHADOW_URL)
+        self.assertEqual(add_changed(shadow, docs), {"sent": 5, "skipped": 0})
+        self.assertEqual(add_changed(solr, docs), {"sent": 1, "skipped": 4})
+
+    def test_forget_on_failure(self):
+        """Check that docs sent before a failed commit are sent again."""
+        solr = get_solr()
+        docs = [{"id": "/terms/1", "name": "Term"}]
+
+        with self.assertRaises(ValueError):
+            with forget_on_failure():
+                add_changed(solr, docs, commit=False)
+                raise ValueError("commit failed")
+
+        self.assertEqual(add_changed(solr, docs), {"sent": 1, "skipped": 0})
+        self.assertEqual(add_changed(solr, docs), {"sent": 0, "skipped": 1})
+
+    def test_build_partitions(self):
+        """Check that partitions cover the key range once, without gaps."""
+        # bulk create skips the search signals.
+        Terms.objects.bulk_create(Terms(term_id=term_id) for term_id in range(2, 11))
+
+        self.assertEqual(
+            partitions.build_partitions("terms", 4),
+            [(1, 4), (4, 7), (7, 10), (10, 13)],
+        )
+
+        # more partitions than keys gives one key each.
+        self.assertEqual(
+            partitions.build_partitions("terms", 20),
+            [(term_id, term_id + 1) for term_id in range(1, 11)],
+        )
+
+        with mock.patch.object(
+            partitions,
+            "partition_queryset",
+            return_value=(Terms.objects.filter(term_id=10), "term_id"),
+        ):
+            self.assertEqual(partitions.build_partitions("terms", 4), [(10, 11)])
+
+        with mock.patch.object(
+            partitions,
+            "partition_queryset",
+            return_value=(Terms.objects.none(), "term_id"),
+        ):
+            self.assertEqual(partitions.build_partitions("terms", 4), [])
+
+    def test_diff_rows(self):
+        """Check that rows are classed as missing, orphaned or stale."""
+        old, new = ("2020-01-01T00:00:00Z",), ("2021-01-01T00:00:00Z",)
+
+        # ids are sorted as strings, as in solr.
+        db = [("1", old), ("10", new), ("2", old), ("4", old)]
+        solr = [("1", old), ("10", old), ("3", old), ("4", old), ("5", old)]
+
+        self.assertEqual(
+            list(diff_rows(iter(db), iter(solr))),
+            [("10", "stale"), ("2", "missing"), ("3", "orphaned"), ("5", "orphaned")],
+        )
+
+        self.assertEqual(
+            list(diff_rows(iter(db), iter([]))),
+            [(atlas_id, "missing") for atlas_id, _ in db],
+        )
+        self.assertEqual(
+            list(diff_rows(iter([]), iter(solr))),
+            [(atlas_id, "orphaned") for atlas_id, _ in solr],
+        )
+        self.assertEqual(list(diff_rows(iter([]), iter([]))), [])
+
+    def test_load_run_ranks(self):
+        """Check that only changed run ranks are sent, and dropped ranks reset."""
+        Reportobjectweightedrunrank.objects.bulk_create(
+            [
+                Reportobjectweightedrunrank(
+                    reportobjectid=1, weighted_run_rank=Decimal("5.1235")
+                ),
+                Reportobjectweightedrunrank(reportobjectid=2, weighted_run_rank=3),
+            ]
+        )
+
+        # report 3 dropped out of the ranks, report 4 never had one.
+        indexed = mock.Mock(
+            docs=[
+                {"atlas_id": [1], "runs": 5.1235},
+                {"atlas_id": [2], "runs": 1.0},
+                {"atlas_id": [3], "runs": 2.0},
+                {"atlas_id": [4]},
+            ],
+            nextCursorMark="*",
+        )
+
+        with mock.patch.object(
+            pysolr.Solr, "search", return_value=indexed
+        ), mock.patch.object(pysolr.Solr, "add") as add, mock.patch.object(
+            pysolr.Solr, "commit"
+        ) as commit:
+            self.assertEqual(load_run_ranks(), {"ranks": 2, "commits": 1})
+
+        add.assert_called_once_with(
+            [
+                {"id": "/reports/2", "runs": 3.0, "_version_": 1},
+                {"id": "/reports/3", "runs": 0.0, "_version_": 1},
+            ],
+            fieldUpdates={"runs": "set"},
+        )
+        commit.assert_called_once()
+
+    def test_delta_search(self):
+        """Check that deltas reload rows changed since the watermark and remove deleted rows."""
+        watermark = timezone.now() - timedelta(hours=1)
+
+        for search_type in ["reports", "terms", "collections", "initiatives"]:
+            set_watermark(search_type, watermark)
+
+        # bulk create skips the search signals.
+        Terms.objects.bulk_create(Terms(term_id=term_id) for term_id in [2, 3])
+        for term_id, changed in [
+            (1, watermark - delta.OVERLAP / 2),
+            (2, watermark - delta.OVERLAP * 2),
+            (3, watermark + timedelta(minutes=1)),
+        ]:
+            Terms.objects.filter(term_id=term_id).update(_modified_at=changed)
+
+        def search(solr, query, **kwargs):
+            docs = [{"atlas_id": [atlas_id]} for atlas_id in [1, 2, 3, 99]]
+            return mock.Mock(
+                docs=docs if query == "type:terms" else [],
+                nextCursorMark=kwargs["cursorMark"],
+            )
+
+        with mock.patch.object(pysolr.Solr, "search", search), mock.patch.object(
+            pysolr.Solr, "delete"
+        ) as delete, mock.patch.object(pysolr.Solr, "commit"), mock.patch.object(
+            delta, "warm_searches"
+        ):
+            output = delta.delta_search()
+
+        # term 1 changed in the overlap before the watermark, term 2 before it.
+        self.assertEqual(output["docs"]["terms"], {"sent": 2, "skipped": 0})
+        self.assertEqual(
+            [doc["id"] for _, docs in self.posts for doc in docs],
+            ["/terms/1", "/terms/3"],
+        )
+
+        delete.assert_called_once_with(q="type:terms AND atlas_id:(99)")
+
+        self.assertEqual(output["commits"], 1)
+        self.assertGreater(get_watermark("terms"), watermark)
+
+    @override_settings(SEARCH_BUFFER=True)
+    def test_flush_search_buffer(self):
+        """Check that buffered ids are loaded once in bulk, and kept when it fails."""
+        client = FakeRedis()
+        task = mock.Mock()
+
+        with mock.patch.object(buffer, "get_redis", return_value=client):
+            for term_id in [3, 1, 3]:
+                buffer.queue_load("terms", term_id, task)
+
+            task.delay.assert_not_called()
+
+            with mock.patch.object(
+                terms, "load_terms", return_value=Counter(sent=1, skipped=1)
+            ) as load:
+                self.assertEqual(
+                    buffer.flush_search_buffer(), {"terms": {"sent": 1, "skipped": 1}}
+                )
+
+            load.assert_called_once_with(ids=[1, 3])
+            self.assertEqual(client.keys, {})
+
+            buffer.queue_load("terms", 2, task)
+
+            with mock.patch.object(terms, "load_terms", side_effect=ValueError):
+                with self.assertRaises(ValueError):
+                    buffer.flush_search_buffer()
+
+            # the ids are loaded again by the next flush.
+            self.assertEqual(client.smembers(buffer.buffer_key("terms")), {b"2"})
+
+    @override_settings(SEARCH_BUFFER=True)
+    def test_flush_report_links(self):
+        """Check that report links are updated in bulk, unless reloaded in full."""
+        client = FakeRedis()
+
+        with mock.patch.object(buffer, "get_redis", return_value=client):
+            Reports.objects.create(report_id=2, name="Report", type_id=1)
+            CollectionReports.objects.create(report_id=1, collection_id=1)
+            CollectionReports.objects.create(report_id=2, collection_id=1)
+            ReportTerms.objects.create(report_doc_id=1, term_id=1)
+
+            self.assertEqual(
+                client.smembers(buffer.buffer_key("report_links")), {b"1", b"2"}
+            )
+
+            with contextlib.ExitStack() as stack:
+                for search_type in ["reports", "terms", "collections"]:
+                    stack.enter_context(
+                        mock.patch(
+                            "etl.tasks.search.%s.load_%s" % (search_type, search_type),
+                            return_value=Counter(sent=1),
+                        )
+                    )
+                update_report_links = stack.enter_context(
+                    mock.patch(
+                        "etl.tasks.search.reports.update_report_links", return_value=1
+                    )
+                )
+
+                counts = buffer.flush_search_buffer()
+
+        # report 2 was reloaded with its links.
+        update_report_links.assert_called_once_with(ids=[1])
+        self.assertEqual(counts["report_links"], {"sent": 1})
+
+    def test_queue_dependents(self):
+        """Check that the docs embedding an edited term or collection are queued."""
+        with mock.patch.object(suppress.reindex_objects, "delay"):
+            with suppress.suppress_search_signals():
+                initiative = Initiatives.objects.create(name="Initiative")
+                collection = Collections.objects.create(
+                    name="Collection", hidden="N", initiative=initiative
+                )
+                term = Terms.objects.create(name="Term")
+                report = Reports.objects.create(name="Report")
+                report_doc = ReportDocs.objects.create(report=report)
+                ReportTerms.objects.create(report_doc=report_doc, term=term)
+                CollectionReports.objects.create(report=report, collection=collection)
+                CollectionTerms.objects.create(collection=collection, term=term)
+
+        with mock.patch.object(terms.load_term, "delay"), mock.patch.object(
+            dependencies, "queue_loads"
+        ) as queue_loads:
+            term.save()
+
+        queue_loads.assert_called_once_with(
+            {
+                "reports": [report.report_id],
+                "collections": [collection.collection_id],
+                "initiatives": [initiative.initiative_id],
+            },
+            suppress.reindex_dependents,
+        )
+
+        # in a block the dependents are only found by the reindex.
+        with mock.patch.object(suppress.reindex_objects, "delay") as reindex:
+            with self.captureOnCommitCallbacks(execute=True):
+                with suppress.suppress_search_signals():
+                    collection.save()
+
+        reindex.assert_called_once_with({"collections": [collection.collection_id]}, {})
+
+        with mock.patch.object(
+            suppress, "reload_objects"
+        ) as reload_objects, mock.patch.object(suppress, "bulk_commit"):
+            suppress.reindex_objects(*reindex.call_args.args)
+
+        reload_objects.assert_called_once_with(
+            {
+                "collections": [collection.collection_id],
+                "reports": [report.report_id],
+                "terms": [term.term_id],
+                "initiatives": [initiative.initiative_id],
+            }
+        )
+
+    def test_flat_report_docs(self):
+        """Check that the flat report source builds the same docs as the orm."""
+        with mock.patch.object(suppress.reindex_objects, "delay"):
+            with suppress.suppress_search_signals():
+                Reports.objects.create(
+                    report_id=2, name="Undocumented report", type_id=1
+                )
+                ReportTerms.objects.create(report_doc_id=1, term_id=1)
+                CollectionReports.objects.create(report_id=1, collection_id=1)
+                CollectionReports.objects.create(report_id=2, collection_id=1)
+                ReportQueries.objects.create(report_id_id=1, query="select 1")
+                ReportQueries.objects.create(report_id_id=1, query="select 2")
+                ReportFragilityTags.objects.create(report_id=1, fragility_tag_id=1)
+                ReportFragilityTags.objects.create(report_id=1, fragility_tag_id=2)
+
+        def normalize(doc):
+            """Sort the list fields, which the sources may order differently."""
+            return {
+                key: sorted(map(str, value)) if isinstance(value, list) else value
+                for key, value in doc.items()
+            }
+
+        docs = {
+            source: {
+                doc["id"]: normalize(doc)
+                for batch in build_doc_batches(Reports.objects.all(), source)
+                for doc in batch
+            }
+            for source in ["orm", "flat"]
+        }
+
+        self.assertEqual(list(docs["flat"]), ["/reports/1", "/reports/2"])
+        self.assertEqual(docs["flat"], docs["orm"])
+
+        doc = docs["flat"]["/reports/1"]
+        self.assertEqual(doc["query"], ["select 1", "select 2"])
+        self.assertEqual(
+            doc["fragility_tags"], ["Facility Build", "Procedure Code (CPT)"]
+        )
+        self.assertEqual(doc["related_terms"], [Terms.objects.get(term_id=1).name])
+        self.assertEqual(
+            doc["related_collections"], [Collections.objects.get(collection_id=1).name]
+        )
+        self.assertEqual(
+            doc["related_initiatives"], [Initiatives.objects.get(initiative_id=1).name]
+        )
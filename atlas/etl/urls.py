@@ -1,7 +1,19 @@
 from django.urls import path
 
 from . import apps
-from .views import base, collections, initiatives, lookups, reports, terms, users
+from .views import (
+    base,
+    collections,
+    consistency,
+    delta,
+    initiatives,
+    lookups,
+    rebuild,
+    reports,
+    run_ranks,
+    terms,
+    users,
+)
 
 app_name = apps.EtlConfig.name
 
@@ -9,6 +21,9 @@ urlpatterns = [
     path("", base.index, name="index"),
     path("solr_health", base.solr_health, name="solr_health"),
     path("celery_health", base.celery_health, name="celery_health"),
+    path("search_cache", base.search_cache, name="search_cache"),
+    path("solr_commits", base.solr_commits, name="solr_commits"),
+    path("search_consistency", base.search_consistency, name="search_consistency"),
     path(
         "search/initiatives/<str:arg>",
         initiatives.initiatives,
@@ -34,6 +49,26 @@ urlpatterns = [
         reports.reports,
         name="search_reports",
     ),
+    path(
+        "search/rebuild/<str:arg>",
+        rebuild.rebuild,
+        name="search_rebuild",
+    ),
+    path(
+        "search/delta/<str:arg>",
+        delta.delta,
+        name="search_delta",
+    ),
+    path(
+        "search/consistency/<str:arg>",
+        consistency.consistency,
+        name="search_consistency_etl",
+    ),
+    path(
+        "search/run_ranks/<str:arg>",
+        run_ranks.run_ranks,
+        name="search_run_ranks",
+    ),
     path(
         "search/lookups/<str:arg>",
         lookups.lookups,
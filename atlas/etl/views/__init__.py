@@ -1,8 +1,13 @@
 """ETL View functions."""
+from datetime import datetime
+
+import pytz
 from django.utils import timezone
 from django_celery_beat.models import CrontabSchedule, PeriodicTask
 from django_celery_results.models import TaskResult
 
+from ..tasks.search.partitions import load_status
+
 
 def solr_schedule():
     """Daily Solr update schedule."""
@@ -15,14 +20,35 @@ def solr_schedule():
     )[0]
 
 
-def build_task_status(task_name, task_function):
-    """Get task status."""
+def build_task_status(task_name, task_function, search_type=None):
+    """Get task status.
+
+    Search resets and rebuilds return once their load is sent to the workers,
+    so with a ``search_type`` the status of the load is used when there is one.
+    """
     task_status = {
         "SUCCESS": "success",
         "STARTED": "warning",
         "FAILURE": "error",
         "NONE": "warning",
     }
+
+    load = load_status(search_type) if search_type else None
+
+    if load:
+        return {
+            "status": task_status[load["status"]],
+            "message": "Last Status: %s; Last Run: %s"
+            % (
+                load["status"],
+                timezone.datetime.strftime(
+                    load["date_done"]
+                    or datetime.fromtimestamp(load["started"], tz=pytz.utc),
+                    "%m/%d/%Y",
+                ),
+            ),
+        }
+
     task = TaskResult.objects.filter(task_name=task_function)
 
     if not task.exists():
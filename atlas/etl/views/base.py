@@ -3,12 +3,16 @@ import json
 import logging
 
 import pysolr
-from django.conf import settings
 from django.http import JsonResponse
 from django.shortcuts import redirect, render
+from django.utils import timezone
 from django.views.decorators.cache import never_cache
 from django_celery_beat.models import PeriodicTask
 from django_celery_results.models import TaskResult
+from etl.tasks.functions import commit_stats
+from etl.tasks.search.consistency import consistency_stats
+from search.cache import cache_stats
+from search.solr import get_solr
 
 from atlas.celery import app as celery_app
 
@@ -17,7 +21,7 @@ from atlas.celery import app as celery_app
 def solr_health(request):
     """Solr Search health check."""
     try:
-        solr = pysolr.Solr(settings.SOLR_URL)
+        solr = get_solr()
 
         solr_status = json.loads(solr.ping())
 
@@ -52,6 +56,66 @@ def celery_health(request):
         return JsonResponse({"message": "Offline", "status": "error"})
 
 
+@never_cache
+def search_cache(request):
+    """Search result cache hit/miss counts."""
+    stats = cache_stats()
+    total = stats["hits"] + stats["misses"]
+
+    return JsonResponse(
+        {
+            "message": "Hits: %s; Misses: %s; Hit Rate: %s%%"
+            % (
+                stats["hits"],
+                stats["misses"],
+                round(stats["hits"] * 100 / total) if total else 0,
+            ),
+            "status": "success",
+        }
+    )
+
+
+@never_cache
+def solr_commits(request):
+    """Solr commit counts of the search etl and realtime updates."""
+    stats = commit_stats()
+
+    return JsonResponse(
+        {
+            "message": "Hard: %s; Soft: %s; Within: %s"
+            % (stats["hard"], stats["soft"], stats["within"]),
+            "status": "success",
+        }
+    )
+
+
+@never_cache
+def search_consistency(request):
+    """Docs that differed from the database in the last consistency check."""
+    stats = consistency_stats()
+
+    if stats is None:
+        return JsonResponse({"message": "Not checked.", "status": "warning"})
+
+    totals = {
+        kind: sum(counts[kind] for counts in stats["types"].values())
+        for kind in ["missing", "orphaned", "stale"]
+    }
+
+    return JsonResponse(
+        {
+            "message": "Missing: %s; Orphaned: %s; Stale: %s; Last Check: %s"
+            % (
+                totals["missing"],
+                totals["orphaned"],
+                totals["stale"],
+                timezone.localtime(stats["checked"]).strftime("%m/%d/%Y %H:%M"),
+            ),
+            "status": "success" if not any(totals.values()) else "warning",
+        }
+    )
+
+
 def index(request):
     """Atlas ETL Dashboard."""
     context = {
@@ -63,6 +127,10 @@ def index(request):
             "initiatives",
             "users",
             "lookups",
+            "run_ranks",
+            "delta",
+            "rebuild",
+            "consistency",
         ],
     }
 
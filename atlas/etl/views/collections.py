@@ -21,7 +21,7 @@ def collections(request, arg):
     task_function = "etl.tasks.search.collections.reset_collections"
 
     if arg == "status":
-        return JsonResponse(build_task_status(task_name, task_function))
+        return JsonResponse(build_task_status(task_name, task_function, "collections"))
 
     elif arg in ["enable", "disable"]:
         return JsonResponse(
@@ -0,0 +1,40 @@
+"""Atlas ETL for Search."""
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from django.views.decorators.cache import never_cache
+
+from ..tasks.search.consistency import check_search as task_check_search
+from . import build_task_status, toggle_task_status
+
+
+@never_cache
+def consistency(request, arg):
+    """Search ETL to find and repair docs that differ from the database.
+
+    Reloads missing and stale docs and removes orphaned ones, without a
+    full reset.
+
+    options:
+        status: returns enabled/disabled status of ETL
+        enable: enables the etl
+        disable: disables the etl
+        trigger: runs the etl
+    """
+    task_name = "search consistency"
+    task_function = "etl.tasks.search.consistency.check_search"
+
+    if arg == "status":
+        return JsonResponse(build_task_status(task_name, task_function))
+
+    elif arg in ["enable", "disable"]:
+        return JsonResponse(
+            {"message": toggle_task_status(task_name, task_function, arg)}
+        )
+
+    elif arg == "run":
+        # Check and repair now.
+        task_check_search.delay()
+
+        return redirect("/etl")
+
+    return JsonResponse({"status": "error"})
@@ -0,0 +1,40 @@
+"""Atlas ETL for Search."""
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from django.views.decorators.cache import never_cache
+
+from ..tasks.search.delta import delta_search as task_delta_search
+from . import build_task_status, toggle_task_status
+
+
+@never_cache
+def delta(request, arg):
+    """Search ETL for changed reports, terms, collections and initiatives.
+
+    Only reloads docs that changed since the last load, and removes deleted
+    ones. Types that were never loaded are fully reset.
+
+    options:
+        status: returns enabled/disabled status of ETL
+        enable: enables the etl
+        disable: disables the etl
+        trigger: runs the etl
+    """
+    task_name = "search delta"
+    task_function = "etl.tasks.search.delta.delta_search"
+
+    if arg == "status":
+        return JsonResponse(build_task_status(task_name, task_function))
+
+    elif arg in ["enable", "disable"]:
+        return JsonResponse(
+            {"message": toggle_task_status(task_name, task_function, arg)}
+        )
+
+    elif arg == "run":
+        # Reload changes now.
+        task_delta_search.delay()
+
+        return redirect("/etl")
+
+    return JsonResponse({"status": "error"})
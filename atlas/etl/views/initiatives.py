@@ -22,7 +22,7 @@ def initiatives(request, arg):
     task_function = "etl.tasks.search.initiatives.reset_initiatives"
 
     if arg == "status":
-        return JsonResponse(build_task_status(task_name, task_function))
+        return JsonResponse(build_task_status(task_name, task_function, "initiatives"))
 
     elif arg in ["enable", "disable"]:
         return JsonResponse(
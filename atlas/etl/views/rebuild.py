@@ -0,0 +1,44 @@
+"""Atlas ETL for Search."""
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from django.views.decorators.cache import never_cache
+
+from ..tasks.search.rebuild import rebuild_search as task_rebuild_search
+from ..tasks.search.rebuild import rollback_search as task_rollback_search
+from . import build_task_status, toggle_task_status
+
+
+@never_cache
+def rebuild(request, arg):
+    """Search ETL for a full rebuild in the shadow core.
+
+    options:
+        status: returns enabled/disabled status of ETL
+        enable: enables the etl
+        disable: disables the etl
+        trigger: runs the etl
+        rollback: swaps the previous index back in
+    """
+    task_name = "search rebuild"
+    task_function = "etl.tasks.search.rebuild.rebuild_search"
+
+    if arg == "status":
+        return JsonResponse(build_task_status(task_name, task_function, "rebuild"))
+
+    elif arg in ["enable", "disable"]:
+        return JsonResponse(
+            {"message": toggle_task_status(task_name, task_function, arg)}
+        )
+
+    elif arg == "run":
+        # Rebuild search now.
+        task_rebuild_search.delay()
+
+        return redirect("/etl")
+
+    elif arg == "rollback":
+        task_rollback_search.delay()
+
+        return redirect("/etl")
+
+    return JsonResponse({"status": "error"})
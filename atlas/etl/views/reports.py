@@ -21,7 +21,7 @@ def reports(request, arg):
     task_function = "etl.tasks.search.reports.reset_reports"
 
     if arg == "status":
-        return JsonResponse(build_task_status(task_name, task_function))
+        return JsonResponse(build_task_status(task_name, task_function, "reports"))
 
     elif arg in ["enable", "disable"]:
         return JsonResponse(
@@ -0,0 +1,39 @@
+"""Atlas ETL for Search."""
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from django.views.decorators.cache import never_cache
+
+from ..tasks.search.reports import load_run_ranks as task_load_run_ranks
+from . import build_task_status, toggle_task_status
+
+
+@never_cache
+def run_ranks(request, arg):
+    """Search ETL for report run ranks.
+
+    Updates the run rank of reports in place, without reindexing them.
+
+    options:
+        status: returns enabled/disabled status of ETL
+        enable: enables the etl
+        disable: disables the etl
+        trigger: runs the etl
+    """
+    task_name = "search run ranks"
+    task_function = "etl.tasks.search.reports.load_run_ranks"
+
+    if arg == "status":
+        return JsonResponse(build_task_status(task_name, task_function))
+
+    elif arg in ["enable", "disable"]:
+        return JsonResponse(
+            {"message": toggle_task_status(task_name, task_function, arg)}
+        )
+
+    elif arg == "run":
+        # Update run ranks now.
+        task_load_run_ranks.delay()
+
+        return redirect("/etl")
+
+    return JsonResponse({"status": "error"})
@@ -21,7 +21,7 @@ def terms(request, arg):
     task_function = "etl.tasks.search.terms.reset_terms"
 
     if arg == "status":
-        return JsonResponse(build_task_status(task_name, task_function))
+        return JsonResponse(build_task_status(task_name, task_function, "terms"))
 
     elif arg in ["enable", "disable"]:
         return JsonResponse(
@@ -21,7 +21,7 @@ def users(request, arg):
     task_function = "etl.tasks.search.users.reset_users"
 
     if arg == "status":
-        return JsonResponse(build_task_status(task_name, task_function))
+        return JsonResponse(build_task_status(task_name, task_function, "users"))
 
     elif arg in ["enable", "disable"]:
         return JsonResponse(
@@ -0,0 +1,146 @@
+"""Search result cache.
+
+Solr results are kept in the default django cache. Each search type has a
+generation counter which the search ETL bumps after it writes to Solr. The
+generations are part of the cache key, so as soon as the index changes the
+old entries are no longer read and simply expire.
+"""
+import contextlib
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+
+from .singleflight import single_flight
+
+SEARCH_TYPES = ["reports", "terms", "collections", "initiatives", "users"]
+
+
+def generation_key(name):
+    """Build the cache key of a generation counter."""
+    return "search:generation:%s" % name
+
+
+def new_generation():
+    """Start value for a missing counter.
+
+    If a counter is evicted it restarts from the current time instead of
+    zero, so it can never fall back to a generation that is still cached.
+    """
+    return int(time.time() * 1000)
+
+
+def cache_is_persistent():
+    """Check if the default cache keeps what is stored in it.
+
+    The dummy cache of the dev and demo settings keeps nothing, so the
+    generations never change and local copies cannot tell they are stale.
+    """
+    return not isinstance(caches["default"], DummyCache)
+
+
+def get_generations(names):
+    """Get the current generation of each name."""
+    keys = [generation_key(name) for name in names]
+    generations = cache.get_many(keys)
+
+    for key in keys:
+        if key not in generations:
+            cache.add(key, new_generation(), timeout=None)
+            generations[key] = cache.get(key, 0)
+
+    return [generations[key] for key in keys]
+
+
+def increment(key, delta=1):
+    """Increment a counter, creating it if needed."""
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            with contextlib.suppress(ValueError):
+                cache.incr(key, delta)
+
+
+def bump_generation(name):
+    """Invalidate all cached searches that depend on ``name``.
+
+    Called by the search ETL after it changes documents of a type. Returns
+    the new generation.
+    """
+    key = generation_key(name)
+    generation = new_generation()
+
+    if cache.add(key, generation, timeout=None):
+        return generation
+
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, generation, timeout=None)
+        return generation
+
+
+def search_type_dependencies(search_type):
+    """Get the document types a search type reads from."""
+    search_type = (search_type or "query").replace("aterms", "terms")
+
+    if search_type in SEARCH_TYPES:
+        return [search_type]
+
+    return SEARCH_TYPES
+
+
+def build_cache_key(search_type, search_string, request_dict, kind="results"):
+    """Build a cache key from the normalized search request."""
+    dependencies = search_type_dependencies(search_type)
+
+    key = json.dumps(
+        [
+            search_type or "query",
+            " ".join((search_string or "").lower().split()),
+            sorted((key, sorted(values)) for key, values in request_dict.items()),
+            list(zip(dependencies, get_generations(dependencies))),
+        ]
+    )
+
+    return "search:%s:%s" % (kind, hashlib.sha1(key.encode("utf8")).hexdigest())
+
+
+def cached_search(
+    search_type, search_string, request_dict, search_function, kind="results"
+):
+    """Get search results from the cache, or run the search and cache it.
+
+    ``kind`` keeps other outputs of the same search, like hit counts, apart
+    from the results. Each caller gets its own copy of the output, unpickled
+    from the cache or copied by ``single_flight``, so views can add to it.
+    """
+    key = build_cache_key(search_type, search_string, request_dict, kind)
+
+    output = cache.get(key)
+
+    if output is not None:
+        increment("search:cache:hits")
+        return output
+
+    increment("search:cache:misses")
+
+    # identical searches running at the same time share one solr request.
+    output = single_flight(key, search_function)
+    cache.set(key, output, timeout=settings.SEARCH_CACHE_TIMEOUT)
+
+    return output
+
+
+def cache_stats():
+    """Get hit and miss counters."""
+    counts = cache.get_many(["search:cache:hits", "search:cache:misses"])
+
+    return {
+        "hits": counts.get("search:cache:hits", 0),
+        "misses": counts.get("search:cache:misses", 0),
+    }
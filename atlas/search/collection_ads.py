@@ -0,0 +1,171 @@
+"""Collection ads.
+
+Search results are followed by the visible collections that contain the
+reports and terms on the page. Instead of joining ``Collections`` for every
+search, each worker keeps an inverted index of report id and term id to
+collection ids, along with the summaries of the visible collections.
+
+The collection ETL marks the index stale and the link signals patch it in
+place. Other workers notice either change through a generation counter in
+the django cache and rebuild on their next search. Without a persistent
+cache workers cannot tell their index is stale, so each search queries the
+collections instead.
+"""
+import threading
+
+from django.db.models import Q
+from index.models import CollectionReports, Collections, CollectionTerms
+
+from .cache import bump_generation, cache_is_persistent, get_generations
+
+GENERATION = "collection_ads"
+
+_lock = threading.Lock()
+_index = {"generation": None, "collections": {}, "reports": {}, "terms": {}}
+
+
+def build_index(generation):
+    """Build the inverted index from the database."""
+    collections = {
+        collection["collection_id"]: collection
+        for collection in Collections.objects.filter(
+            Q(hidden__isnull=True) | Q(hidden="N")
+        ).values("collection_id", "search_summary", "name")
+    }
+
+    reports: dict = {}
+    for report_id, collection_id in CollectionReports.objects.filter(
+        report__isnull=False, collection__isnull=False
+    ).values_list("report_id", "collection_id"):
+        reports.setdefault(report_id, set()).add(collection_id)
+
+    terms: dict = {}
+    for term_id, collection_id in CollectionTerms.objects.filter(
+        term__isnull=False, collection__isnull=False
+    ).values_list("term_id", "collection_id"):
+        terms.setdefault(term_id, set()).add(collection_id)
+
+    return {
+        "generation": generation,
+        "collections": collections,
+        "reports": reports,
+        "terms": terms,
+    }
+
+
+def get_index():
+    """Get the local index, rebuilding it if another worker changed it."""
+    global _index  # pylint: disable=W0603
+
+    generation = get_generations([GENERATION])[0]
+
+    if _index["generation"] != generation:
+        with _lock:
+            if _index["generation"] != generation:
+                _index = build_index(generation)
+
+    return _index
+
+
+def get_collection_ads(report_ids, term_ids):
+    """Get summaries of the visible collections holding any of the ids."""
+    if not cache_is_persistent():
+        return query_collection_ads(report_ids, term_ids)
+
+    index = get_index()
+
+    collection_ids = set()
+    for report_id in report_ids:
+        collection_ids |= index["reports"].get(report_id, set())
+    for term_id in term_ids:
+        collection_ids |= index["terms"].get(term_id, set())
+
+    return [
+        index["collections"][collection_id]
+        for collection_id in sorted(collection_ids)
+        if collection_id in index["collections"]
+    ]
+
+
+def query_collection_ads(report_ids, term_ids):
+    """Get the collection summaries from the database."""
+    return list(
+        Collections.objects.filter(
+            Q(terms__term__term_id__in=term_ids)
+            | Q(reports__report__report_id__in=report_ids)
+        )
+        .filter(Q(hidden__isnull=True) | Q(hidden="N"))
+        .values("collection_id", "search_summary", "name")
+        .distinct()
+    )
+
+
+def patch_index(patch):
+    """Apply a change to the local index and publish a new generation.
+
+    The local index keeps up with the new generation only if it was current
+    before the change. Otherwise it is left stale and rebuilt on next use.
+    """
+    with _lock:
+        patch(_index)
+
+        generation = bump_generation(GENERATION)
+
+        if generation is not None and _index["generation"] == generation - 1:
+            _index["generation"] = generation
+
+
+def reset_collection_ads():
+    """Mark the index stale in every worker."""
+    bump_generation(GENERATION)
+
+
+def add_report_link(collection_id, report_id):
+    """Add a report to a collection."""
+    patch_index(
+        lambda index: index["reports"].setdefault(report_id, set()).add(
+            collection_id
+        )
+    )
+
+
+def remove_report_link(collection_id, report_id):
+    """Remove a report from a collection."""
+    patch_index(
+        lambda index: index["reports"].get(report_id, set()).discard(collection_id)
+    )
+
+
+def add_term_link(collection_id, term_id):
+    """Add a term to a collection."""
+    patch_index(
+        lambda index: index["terms"].setdefault(term_id, set()).add(collection_id)
+    )
+
+
+def remove_term_link(collection_id, term_id):
+    """Remove a term from a collection."""
+    patch_index(
+        lambda index: index["terms"].get(term_id, set()).discard(collection_id)
+    )
+
+
+def update_collection(collection):
+    """Update, add or hide a collection summary."""
+
+    def patch(index):
+        if collection.hidden in [None, "N"]:
+            index["collections"][collection.collection_id] = {
+                "collection_id": collection.collection_id,
+                "search_summary": collection.search_summary,
+                "name": collection.name,
+            }
+        else:
+            index["collections"].pop(collection.collection_id, None)
+
+    patch_index(patch)
+
+
+def remove_collection(collection_id):
+    """Remove a deleted collection."""
+    patch_index(lambda index: index["collections"].pop(collection_id, None))
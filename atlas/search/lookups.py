@@ -0,0 +1,87 @@
+"""Dropdown lookups.
+
+Lookup lists (fragility, run frequency, maintenance schedule, ...) change a
+few times a year, so every worker keeps all of them in memory. The lookup
+ETL bumps a generation in the django cache after it writes to the lookup
+core, and a worker reloads the lists when its copy is behind. Without a
+persistent cache workers cannot tell their copy is behind, so each request
+queries its list from the lookup core instead.
+
+Each list has a strong ETag so browsers can revalidate it instead of
+downloading it again on every edit page.
+"""
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+
+from .cache import cache_is_persistent, get_generations
+from .solr import get_solr
+
+GENERATION = "lookups"
+
+_lock = threading.Lock()
+_lookups = {"generation": None, "values": {}, "etags": {}}
+
+
+def build_etag(values):
+    """Build a strong ETag from a lookup list."""
+    return '"%s"' % hashlib.sha1(json.dumps(values).encode("utf8")).hexdigest()
+
+
+def load_lookups(generation):
+    """Load every lookup list from solr in one request."""
+    solr = get_solr(settings.SOLR_LOOKUP_URL)
+
+    values: dict = {}
+    for value in solr.search(
+        "*:*", fl="atlas_id,item_name,item_type", **{"rows": 99999}
+    ):
+        values.setdefault(value.get("item_type"), []).append(
+            {"ObjectId": value.get("atlas_id"), "Name": value.get("item_name")}
+        )
+
+    return {
+        "generation": generation,
+        "values": values,
+        "etags": {item_type: build_etag(items) for item_type, items in values.items()},
+    }
+
+
+def query_lookup(item_type):
+    """Load one lookup list from solr."""
+    solr = get_solr(settings.SOLR_LOOKUP_URL)
+
+    return [
+        {"ObjectId": value.get("atlas_id"), "Name": value.get("item_name")}
+        for value in solr.search("item_type:%s" % item_type, **{"rows": 9999})
+    ]
+
+
+def get_lookups():
+    """Get the local lookup lists, reloading them if the lookup ETL ran."""
+    global _lookups  # pylint: disable=W0603
+
+    generation = get_generations([GENERATION])[0]
+
+    if _lookups["generation"] != generation:
+        with _lock:
+            if _lookups["generation"] != generation:
+                _lookups = load_lookups(generation)
+
+    return _lookups
+
+
+def get_lookup(item_type):
+    """Get a lookup list and its ETag."""
+    if not cache_is_persistent():
+        values = query_lookup(item_type)
+        return values, build_etag(values)
+
+    lookups = get_lookups()
+
+    return (
+        lookups["values"].get(item_type, []),
+        lookups["etags"].get(item_type, build_etag([])),
+    )
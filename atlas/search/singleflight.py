@@ -0,0 +1,101 @@
+"""Request coalescing.
+
+Identical searches that arrive together share one solr request. Inside a
+worker the first request runs the search and the others wait for its
+result. With ``SEARCH_SINGLE_FLIGHT_SHARED`` the first request also takes a
+short lock in the django cache and publishes its result there, so identical
+requests in other workers wait for it instead of querying solr.
+
+Waiting is capped by ``SEARCH_SINGLE_FLIGHT_TIMEOUT``; a request that waits
+too long, or whose leader fails, runs its own search.
+
+The views add to the results they get, so every caller gets its own copy.
+"""
+import copy
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+_lock = threading.Lock()
+_flights: dict = {}
+
+
+class Flight:
+    """An in-flight search."""
+
+    def __init__(self):
+        """Create an unfinished flight."""
+        self.done = threading.Event()
+        self.failed = False
+        self.result = None
+
+
+def flight_key(*parts):
+    """Build a short key from the parts of a request."""
+    return hashlib.sha1(repr(parts).encode("utf8")).hexdigest()
+
+
+def single_flight(key, function):
+    """Run ``function`` once for all concurrent callers with the same key.
+
+    Each caller gets its own copy of the result.
+    """
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+
+    if not leader:
+        if (
+            flight.done.wait(settings.SEARCH_SINGLE_FLIGHT_TIMEOUT)
+            and not flight.failed
+        ):
+            return copy.deepcopy(flight.result)
+        return function()
+
+    try:
+        if settings.SEARCH_SINGLE_FLIGHT_SHARED:
+            flight.result = shared_flight(key, function)
+        else:
+            flight.result = function()
+    except Exception:
+        flight.failed = True
+        raise
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+    return copy.deepcopy(flight.result)
+
+
+def shared_flight(key, function):
+    """Share one search between workers through the django cache."""
+    lock_key = "search:flight:lock:%s" % key
+    result_key = "search:flight:result:%s" % key
+    timeout = settings.SEARCH_SINGLE_FLIGHT_TIMEOUT
+
+    if cache.add(lock_key, 1, timeout=timeout):
+        try:
+            result = function()
+            cache.set(result_key, result, timeout=timeout)
+            return result
+        finally:
+            cache.delete(lock_key)
+
+    # another worker is searching. wait for its result while it holds the lock.
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = cache.get(result_key)
+        if result is not None:
+            return result
+        if cache.get(lock_key) is None:
+            break
+        time.sleep(0.02)
+
+    result = cache.get(result_key)
+    return result if result is not None else function()
@@ -0,0 +1,147 @@
+"""Shared Solr clients.
+
+Creating a ``pysolr.Solr`` also creates a new ``requests`` session, which
+means a new TCP/TLS handshake for every search. Clients are instead kept in a
+process wide registry, keyed by core url and handler, and all clients for a
+core share one keep-alive connection pool.
+
+The registry is dropped in forked children (gunicorn and celery workers both
+fork after importing the app) so that sockets are never shared between
+processes.
+"""
+import json
+import os
+import threading
+
+import pysolr
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+_lock = threading.Lock()
+_clients: dict = {}
+_sessions: dict = {}
+_pid = os.getpid()
+
+
+def reset_solr_clients():
+    """Forget all clients and sessions.
+
+    Used after a fork. The parent's sockets are left alone; the child simply
+    stops referencing them and will open its own pool on first use.
+    """
+    global _lock, _pid  # pylint: disable=W0603
+
+    _lock = threading.Lock()
+    _clients.clear()
+    _sessions.clear()
+    _pid = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_solr_clients)
+
+
+def build_session():
+    """Build a requests session with a keep-alive connection pool."""
+    session = requests.Session()
+    session.stream = False
+
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.SOLR_POOL_SIZE,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def get_solr(url=None, search_handler="select", always_commit=False):
+    """Get a pooled solr client.
+
+    :param url: core url, defaults to ``settings.SOLR_URL``.
+    :param search_handler: request handler used by ``search()``.
+    :param always_commit: commit after every update.
+    """
+    url = url or settings.SOLR_URL
+
+    # pid check covers platforms without os.register_at_fork.
+    if _pid != os.getpid():
+        reset_solr_clients()
+
+    key = (url, search_handler, always_commit)
+
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                if url not in _sessions:
+                    _sessions[url] = build_session()
+
+                client = pysolr.Solr(
+                    url,
+                    search_handler=search_handler,
+                    always_commit=always_commit,
+                    timeout=settings.SOLR_TIMEOUT,
+                    session=_sessions[url],
+                )
+                _clients[key] = client
+
+    return client
+
+
+def core_name(url):
+    """Get the core name from a core url."""
+    return url.rstrip("/").rsplit("/", 1)[1]
+
+
+def core_admin(action, url=None, **params):
+    """Run a core admin action on the solr server of a core.
+
+    Uses the core's connection pool. Raises ``pysolr.SolrError`` if solr
+    rejects the action.
+    """
+    url = url or settings.SOLR_URL
+    admin_url = "%s/admin/cores" % url.rstrip("/").rsplit("/", 1)[0]
+
+    response = get_solr(url).session.get(
+        admin_url,
+        params={"action": action, "wt": "json", **params},
+        timeout=settings.SOLR_TIMEOUT,
+    )
+
+    if response.status_code != 200:
+        raise pysolr.SolrError(
+            "Core admin %s failed: %s" % (action, response.text[:500])
+        )
+
+    return response.json()
+
+
+def stream_docs(solr, docs, **params):
+    """Stream docs to a core as json lines.
+
+    Each doc is serialized as the request body is sent, in a chunked request
+    on the client's connection pool, so a generator of docs is never held in
+    memory. Values json can not encode, like the decimal ids of reports, are
+    sent as strings. ``params`` are update params, as ``commitWithin``.
+    Raises ``pysolr.SolrError`` if solr rejects the update.
+    """
+    response = solr.session.post(
+        "%s/update/json/docs" % solr.url.rstrip("/"),
+        data=(json.dumps(doc, default=str).encode("utf-8") + b"\n" for doc in docs),
+        params={
+            "wt": "json",
+            **{
+                key: str(value).lower() if isinstance(value, bool) else value
+                for key, value in params.items()
+            },
+        },
+        headers={"Content-Type": "application/json"},
+        timeout=solr.timeout,
+    )
+
+    if response.status_code != 200:
+        raise pysolr.SolrError("Update failed: %s" % response.text[:500])
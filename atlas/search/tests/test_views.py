@@ -1,2 +1,340 @@
-"""Atlas search tests."""
-# Create your tests here.
+"""Atlas search tests.
+
+Run test for this app with::
+
+    poetry run coverage erase; \
+    poetry run coverage run -p manage.py \
+        test search/ --no-input --pattern="test_views.py" --settings atlas.settings.test; \
+    poetry run coverage combine; \
+    poetry run coverage report --include "search*" -m
+
+"""
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+from index.models import Terms
+from search import typeahead
+from search.cache import bump_generation, cached_search
+from search.singleflight import single_flight
+from search.views import build_field_list, build_filter_query, solr_search
+
+from atlas.testutils import AtlasTestCase
+
+# pylint: disable=C0103,W0105,C0115
+
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class SearchTestCase(AtlasTestCase):
+    def test_filter_query_pagination(self):
+        """Check that pagination and field params are not used as filters."""
+        filter_query = build_filter_query(
+            {
+                "visibility_text": ["Y"],
+                "start": ["10"],
+                "cursor": ["*"],
+                "fields": ["description"],
+                "type": ["reports"],
+            }
+        )
+
+        self.assertEqual(
+            filter_query,
+            "{!tag=visibility_text}visibility_text:Y,{!tag=type}type:reports",
+        )
+
+    def test_field_list(self):
+        """Check that extra fields are added to the card fields."""
+        self.assertEqual(build_field_list({}), {})
+
+        field_list = build_field_list({"fields": ["description,[child],x:y"]})["fl"]
+
+        self.assertTrue(field_list.startswith("id,name,"))
+        self.assertTrue(field_list.endswith(",description"))
+        self.assertNotIn("[child]", field_list)
+        self.assertNotIn("x:y", field_list)
+
+    def test_description_fields(self):
+        """Check that summaries only replace descriptions nobody asked for."""
+        results = mock.Mock(
+            docs=[{"id": "/reports/1", "description": ["Full description"]}],
+            highlighting={"/reports/1": {"description": ["Full"]}},
+            hits=1,
+            qtime=1,
+            nextCursorMark=None,
+            facets={},
+        )
+
+        def search(request_dict):
+            results.docs[0]["description"] = ["Full description"]
+
+            with mock.patch("search.views.get_solr") as get_solr:
+                get_solr.return_value.search.return_value = results
+                return solr_search("reports", "full", request_dict)["docs"][0]
+
+        self.assertEqual(search({})["description"], ["Full"])
+        self.assertEqual(search({"fields": ["name"]})["description"], ["Full"])
+        self.assertEqual(search({"fields": ["*"]})["description"], ["Full description"])
+        self.assertEqual(
+            search({"fields": ["description"]})["description"], ["Full description"]
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class SearchCacheTestCase(AtlasTestCase):
+    def setUp(self):
+        """Start each test with an empty cache."""
+        super().setUp()
+        cache.clear()
+
+    def test_cached_search_generation(self):
+        """Check that cached searches are run again when their type changes."""
+        search = mock.Mock(return_value={"docs": []})
+
+        cached_search("reports", "Length  of Stay", {}, search)
+        cached_search("reports", "length of stay", {}, search)
+        self.assertEqual(search.call_count, 1)
+
+        # other types do not invalidate a report search.
+        bump_generation("terms")
+        cached_search("reports", "length of stay", {}, search)
+        self.assertEqual(search.call_count, 1)
+
+        bump_generation("reports")
+        cached_search("reports", "length of stay", {}, search)
+        self.assertEqual(search.call_count, 2)
+
+        # the query tab reads every type.
+        cached_search("query", "length of stay", {}, search)
+        bump_generation("terms")
+        cached_search("query", "length of stay", {}, search)
+        self.assertEqual(search.call_count, 4)
+
+    def test_federated(self):
+        """Check the tab counts and active tab of a federated search."""
+        hits = {
+            "query": 10,
+            "reports": 4,
+            "aterms": 3,
+            "collections": 2,
+            "initiatives": 1,
+            "users": 0,
+        }
+
+        def get_solr(search_handler="select", **kwargs):
+            solr = mock.Mock()
+            solr.search.return_value = mock.Mock(
+                docs=[{"id": "/reports/1", "type": ["reports"], "atlas_id": [1]}],
+                highlighting={},
+                hits=hits[search_handler],
+                qtime=1,
+                nextCursorMark="next",
+                facets={},
+            )
+            return solr
+
+        self.login()
+
+        with mock.patch("search.views.get_solr", side_effect=get_solr):
+            federated = self.client.get("/search/federated/reports/stay").json()
+
+            cache.clear()
+            search = self.client.get("/search/reports/stay").json()
+
+        self.assertEqual(
+            federated.pop("counts"),
+            {
+                "query": 10,
+                "reports": 4,
+                "terms": 3,
+                "collections": 2,
+                "initiatives": 1,
+                "users": 0,
+            },
+        )
+        self.assertEqual(federated, search)
+
+    def test_lookup_etag(self):
+        """Check that lookups are revalidated until the lookup ETL runs."""
+        self.login()
+
+        with mock.patch("search.lookups.get_solr") as get_solr:
+            get_solr.return_value.search.return_value = [
+                {"atlas_id": 1, "item_name": "Low", "item_type": "fragility"}
+            ]
+
+            response = self.client.get("/search/lookup/fragility")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), [{"ObjectId": 1, "Name": "Low"}])
+
+            etag = response["ETag"]
+
+            response = self.client.get(
+                "/search/lookup/fragility", HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, 304)
+
+            get_solr.return_value.search.return_value.append(
+                {"atlas_id": 2, "item_name": "High", "item_type": "fragility"}
+            )
+            bump_generation("lookups")
+
+            response = self.client.get(
+                "/search/lookup/fragility", HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()), 2)
+            self.assertNotEqual(response["ETag"], etag)
+
+
+@override_settings(CACHES=LOCAL_CACHE, SEARCH_TYPEAHEAD=True)
+class TypeaheadTestCase(AtlasTestCase):
+    def setUp(self):
+        """Start each test with an empty cache and no local indexes."""
+        super().setUp()
+        cache.clear()
+
+        patcher = mock.patch.dict(typeahead._indexes, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # bulk create skips the search signals.
+        Terms.objects.bulk_create(
+            [
+                Terms(term_id=101, name="Patient Safety"),
+                Terms(term_id=102, name="Stay Length"),
+            ]
+        )
+
+    def names(self, search_string):
+        """Get the names found by a term typeahead search."""
+        return [doc["Name"] for doc in typeahead.search("terms", search_string)]
+
+    def test_typeahead_prefix(self):
+        """Check that every search word must start a word of the name."""
+        self.assertEqual(self.names("pat"), ["Patient Safety"])
+        self.assertEqual(self.names("sta len"), ["Stay Length", "LOS Length of Stay"])
+        self.assertEqual(self.names("LENGTH"), ["Stay Length", "LOS Length of Stay"])
+        self.assertEqual(self.names("ength"), [])
+        self.assertEqual(self.names(" "), [])
+
+    def test_typeahead_replay(self):
+        """Check that other workers replay published changes without a rebuild."""
+        self.assertEqual(self.names("safety"), ["Patient Safety"])
+
+        # publish from "another worker", which has no local index to patch.
+        with mock.patch.dict(typeahead._indexes, clear=True):
+            typeahead.publish_change("terms", 101, "Patient Harm")
+            typeahead.publish_change("terms", 103, "Harm Events")
+
+        with mock.patch.object(typeahead, "build_index") as build_index:
+            self.assertEqual(self.names("harm"), ["Harm Events", "Patient Harm"])
+            self.assertEqual(self.names("safety"), [])
+            self.assertFalse(build_index.called)
+
+        # with a missing change the index is rebuilt from the database.
+        cache.delete(
+            typeahead.change_key("terms", typeahead._indexes["terms"]["generation"])
+        )
+        typeahead._indexes["terms"]["generation"] -= 1
+
+        self.assertEqual(self.names("safety"), ["Patient Safety"])
+
+
+class SingleFlightTestCase(AtlasTestCase):
+    def test_single_flight(self):
+        """Check that concurrent identical searches share one call."""
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def search():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {"docs": [1]}
+
+        def run(key):
+            results.append(single_flight(key, search))
+
+        threads = [threading.Thread(target=run, args=("same",))]
+        threads[0].start()
+        started.wait(5)
+
+        threads += [threading.Thread(target=run, args=("same",)) for _ in range(3)]
+        threads.append(threading.Thread(target=run, args=("other",)))
+        for thread in threads[1:]:
+            thread.start()
+
+        # let the followers join the flight before the leader returns.
+        time.sleep(0.2)
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(results, [{"docs": [1]}] * 5)
+
+    def test_single_flight_copies(self):
+        """Check that callers sharing a search can each change their results."""
+        started = threading.Event()
+        release = threading.Event()
+        results = {}
+
+        def search():
+            started.set()
+            release.wait(5)
+            return {"docs": [1]}
+
+        def run(name):
+            output = single_flight("same", search)
+            output["docs"].append(name)
+            output["collections"] = name
+            results[name] = output
+
+        threads = [threading.Thread(target=run, args=("leader",))]
+        threads[0].start()
+        started.wait(5)
+
+        threads.append(threading.Thread(target=run, args=("follower",)))
+        threads[1].start()
+
+        # let the follower join the flight before the leader returns.
+        time.sleep(0.2)
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(
+            results["leader"], {"docs": [1, "leader"], "collections": "leader"}
+        )
+        self.assertEqual(
+            results["follower"], {"docs": [1, "follower"], "collections": "follower"}
+        )
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_cached_search_copies(self):
+        """Check that changing a cached result does not change the cache."""
+        cache.clear()
+        search = mock.Mock(return_value={"docs": [1]})
+
+        output = cached_search("reports", "stay", {}, search)
+        output["docs"].append(2)
+
+        self.assertEqual(cached_search("reports", "stay", {}, search), {"docs": [1]})
+        self.assertEqual(search.return_value, {"docs": [1]})
+
+    def test_single_flight_failure(self):
+        """Check that the error of a search is raised, and the next call retries."""
+        search = mock.Mock(side_effect=[ValueError("solr is down"), {"docs": []}])
+
+        with self.assertRaises(ValueError):
+            single_flight("same", search)
+
+        self.assertEqual(single_flight("same", search), {"docs": []})
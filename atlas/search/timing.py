@@ -0,0 +1,181 @@
+"""Search timings.
+
+The search and lookup views time each stage of a request (query build, solr
+round trip, solr QTime, facet reshaping, collection ads, serialization) and
+return them in a ``Server-Timing`` header along with the payload size, so
+the browser dev tools show where a slow search spends its time.
+
+The stages of a sample of the requests are also counted in a latency
+histogram in the django cache, which is charted on the analytics page.
+``SEARCH_TIMING_SAMPLE`` is the share of requests counted, and each one
+counts for the requests left out, so most requests write nothing to the
+cache. With ``SEARCH_TIMING_LOG`` every request also writes a json log line
+to the ``search.timing`` logger.
+"""
+import contextlib
+import functools
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import increment
+
+logger = logging.getLogger(__name__)
+
+VIEWS = [
+    "search",
+    "federated",
+    "users",
+    "collections",
+    "reports",
+    "terms",
+    "lookups",
+]
+STAGES = [
+    "query",
+    "solr",
+    "qtime",
+    "facets",
+    "collections",
+    "lookup",
+    "serialize",
+    "total",
+]
+
+# upper bound (ms) of each histogram bucket. slower requests go in a last bucket.
+BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500]
+
+
+class Timer:
+    """Stage timings of one request."""
+
+    def __init__(self, view):
+        """Start timing a request."""
+        self.view = view
+        self.started = time.perf_counter()
+        self.timings: dict = {}
+        self.size = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a block of code."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name, duration):
+        """Add a duration in ms to a stage."""
+        self.timings[name] = self.timings.get(name, 0) + duration
+
+    def header(self):
+        """Build the Server-Timing header."""
+        metrics = [
+            "%s;dur=%.1f" % (name, duration) for name, duration in self.timings.items()
+        ]
+
+        if self.size is not None:
+            metrics.append('payload;desc="%s bytes"' % self.size)
+
+        return ", ".join(metrics)
+
+
+def bucket_key(view, stage, bucket):
+    """Build the cache key of a histogram bucket."""
+    return "search:timing:%s:%s:%s" % (view, stage, bucket)
+
+
+def get_bucket(duration):
+    """Get the histogram bucket of a duration in ms."""
+    for bucket in BUCKETS:
+        if duration < bucket:
+            return bucket
+    return "max"
+
+
+def record(timer, response):
+    """Add the timings to a response, the histogram and the log."""
+    timer.add("total", (time.perf_counter() - timer.started) * 1000)
+
+    if not response.streaming:
+        timer.size = len(response.content)
+
+    response["Server-Timing"] = timer.header()
+
+    sample = settings.SEARCH_TIMING_SAMPLE
+    if sample and random.random() < sample:
+        for name, duration in timer.timings.items():
+            increment(
+                bucket_key(timer.view, name, get_bucket(duration)), round(1 / sample)
+            )
+
+    if settings.SEARCH_TIMING_LOG:
+        logger.info(
+            json.dumps(
+                {
+                    "view": timer.view,
+                    "status": response.status_code,
+                    "bytes": timer.size,
+                    "timings": {
+                        name: round(duration, 1)
+                        for name, duration in timer.timings.items()
+                    },
+                }
+            )
+        )
+
+    return response
+
+
+def timed(view):
+    """Time a search view.
+
+    The view gets a ``Timer`` as ``request.search_timer`` to time its stages.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(request, *args, **kwargs):
+            request.search_timer = Timer(view)
+            response = function(request, *args, **kwargs)
+            return record(request.search_timer, response)
+
+        return wrapper
+
+    return decorator
+
+
+def histogram():
+    """Get the request counts of each view and stage by bucket.
+
+    Returns ``{view: {stage: [(bucket label, count), ...]}}`` for the views
+    and stages that have been recorded.
+    """
+    buckets = BUCKETS + ["max"]
+    labels = ["< %s ms" % bucket for bucket in BUCKETS] + [">= %s ms" % BUCKETS[-1]]
+
+    counts = cache.get_many(
+        [
+            bucket_key(view, stage, bucket)
+            for view in VIEWS
+            for stage in STAGES
+            for bucket in buckets
+        ]
+    )
+
+    output: dict = {}
+    for view in VIEWS:
+        for stage in STAGES:
+            stage_counts = [
+                counts.get(bucket_key(view, stage, bucket), 0) for bucket in buckets
+            ]
+
+            if any(stage_counts):
+                output.setdefault(view, {})[stage] = list(zip(labels, stage_counts))
+
+    return output
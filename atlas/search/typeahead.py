@@ -0,0 +1,205 @@
+"""Typeahead lookups.
+
+The editor pickers search users, reports, terms and collections on every
+keystroke. When ``SEARCH_TYPEAHEAD`` is enabled each worker keeps a sorted
+array of ``(word, atlas_id)`` per type and answers word prefix matches with a
+binary search. Anything the prefix index cannot answer falls back to the
+fuzzy solr search.
+
+The search signals patch the local index and publish each change under a
+new generation in the django cache. Workers that are a few generations
+behind replay the published changes; workers that are further behind, or
+miss a change, rebuild the type from the database. Without a persistent
+cache workers cannot tell their index is stale, so the pickers use the
+fuzzy solr search instead.
+"""
+import bisect
+import re
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from index.models import Collections, Reports, Terms, Users
+
+from .cache import bump_generation, cache_is_persistent, get_generations
+
+# changes older than this are not replayed, the index is rebuilt instead.
+MAX_REPLAY = 100
+
+_lock = threading.Lock()
+_indexes: dict = {}
+
+
+def split_words(name):
+    """Split a name into lowercase words."""
+    return [word for word in re.split(r"\W+", (name or "").lower()) if word]
+
+
+def load_names(index_type):
+    """Get (atlas_id, name) pairs of the objects shown in the pickers."""
+    if index_type == "reports":
+        return (
+            (report["report_id"], report["title"] or report["name"])
+            for report in Reports.objects.filter(visible="Y")
+            .exclude(orphan="Y")
+            .values("report_id", "title", "name")
+        )
+
+    if index_type == "terms":
+        return Terms.objects.values_list("term_id", "name")
+
+    if index_type == "collections":
+        return Collections.objects.filter(
+            ~Q(hidden="Y") | Q(hidden=None)
+        ).values_list("collection_id", "name")
+
+    return ((user.user_id, str(user)) for user in Users.objects.all().iterator())
+
+
+def build_index(index_type, generation):
+    """Build the prefix index of a type from the database."""
+    names = dict(load_names(index_type))
+
+    return {
+        "generation": generation,
+        "names": names,
+        "words": sorted(
+            (word, atlas_id)
+            for atlas_id, name in names.items()
+            for word in set(split_words(name))
+        ),
+    }
+
+
+def apply_change(index, change):
+    """Add, rename or remove one object in an index."""
+    atlas_id, name = change
+
+    for word in set(split_words(index["names"].pop(atlas_id, None))):
+        position = bisect.bisect_left(index["words"], (word, atlas_id))
+        if position < len(index["words"]) and index["words"][position] == (
+            word,
+            atlas_id,
+        ):
+            del index["words"][position]
+
+    if name is not None:
+        index["names"][atlas_id] = name
+        for word in set(split_words(name)):
+            bisect.insort(index["words"], (word, atlas_id))
+
+
+def change_key(index_type, generation):
+    """Cache key of a published change."""
+    return "search:typeahead:%s:%s" % (index_type, generation)
+
+
+def get_index(index_type):
+    """Get the local index of a type, catching up with other workers."""
+    name = "typeahead_%s" % index_type
+    generation = get_generations([name])[0]
+
+    index = _indexes.get(index_type)
+
+    if index is not None and index["generation"] == generation:
+        return index
+
+    with _lock:
+        index = _indexes.get(index_type)
+
+        if index is not None and 0 < generation - index["generation"] <= MAX_REPLAY:
+            missing = range(index["generation"] + 1, generation + 1)
+            changes = cache.get_many(
+                [change_key(index_type, number) for number in missing]
+            )
+
+            if len(changes) == len(missing):
+                for number in missing:
+                    apply_change(index, changes[change_key(index_type, number)])
+                index["generation"] = generation
+
+        if index is None or index["generation"] != generation:
+            index = build_index(index_type, generation)
+            _indexes[index_type] = index
+
+    return index
+
+
+def publish_change(index_type, atlas_id, name=None):
+    """Patch the local index and publish the change to other workers.
+
+    A ``name`` of None removes the object.
+    """
+    if not settings.SEARCH_TYPEAHEAD:
+        return
+
+    with _lock:
+        generation = bump_generation("typeahead_%s" % index_type)
+
+        if generation is None:
+            return
+
+        cache.set(
+            change_key(index_type, generation),
+            (atlas_id, name),
+            timeout=settings.SEARCH_CACHE_TIMEOUT,
+        )
+
+        index = _indexes.get(index_type)
+        if index is not None and index["generation"] == generation - 1:
+            apply_change(index, (atlas_id, name))
+            index["generation"] = generation
+
+
+def reset_typeahead(index_type):
+    """Make every worker rebuild the index of a type."""
+    bump_generation("typeahead_%s" % index_type)
+
+
+def search(index_type, search_string, rows=20):
+    """Find objects with a word starting with each word of the search.
+
+    Names starting with the search are listed first, then shorter names.
+    Returns an empty list when the typeahead is disabled, the cache is not
+    persistent or nothing matches.
+    """
+    search_words = split_words(search_string)
+
+    if not settings.SEARCH_TYPEAHEAD or not cache_is_persistent() or not search_words:
+        return []
+
+    index = get_index(index_type)
+
+    # scan the most selective word, then check the others against the name.
+    longest = max(search_words, key=len)
+    position = bisect.bisect_left(index["words"], (longest,))
+
+    matches = set()
+    for word, atlas_id in index["words"][
+        position : position + settings.SEARCH_TYPEAHEAD_SCAN  # noqa: E203
+    ]:
+        if not word.startswith(longest):
+            break
+
+        name_words = split_words(index["names"][atlas_id])
+        if all(
+            any(name_word.startswith(search_word) for name_word in name_words)
+            for search_word in search_words
+        ):
+            matches.add(atlas_id)
+
+    search_string = " ".join(search_words)
+
+    return [
+        # atlas_id is a list to match the solr response.
+        {"ObjectId": [atlas_id], "Name": index["names"][atlas_id]}
+        for atlas_id in sorted(
+            matches,
+            key=lambda atlas_id: (
+                not index["names"][atlas_id].lower().startswith(search_string),
+                len(index["names"][atlas_id]),
+                index["names"][atlas_id].lower(),
+            ),
+        )[:rows]
+    ]
@@ -25,4 +25,10 @@ urlpatterns = [
         views.index,
         name="index",
     ),
+    # counts of all tabs and results of the active tab in one request.
+    path(
+        "federated/<str:search_type>/<str:search_string>",
+        views.federated,
+        name="federated",
+    ),
 ]
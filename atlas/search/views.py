@@ -2,15 +2,38 @@
 import contextlib
 import copy
 import functools
+import re
+from concurrent.futures import ThreadPoolExecutor
 
-import pysolr
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
 from django.http import JsonResponse
 from django.shortcuts import render
-from django.views.decorators.cache import never_cache
-from index.models import Collections
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import condition
+
+from . import typeahead
+from .cache import cache_is_persistent, cached_search
+from .collection_ads import get_collection_ads
+from .lookups import get_lookup
+from .singleflight import flight_key, single_flight
+from .solr import get_solr
+from .timing import Timer, timed
+
+# tabs on the search page.
+SEARCH_TABS = ["query", "reports", "terms", "collections", "initiatives", "users"]
+
+# fields used by the result cards. "fields" adds to these.
+CARD_FIELDS = [
+    "id",
+    "name",
+    "type",
+    "atlas_id",
+    "certification",
+    "documented",
+    "email",
+    "epic_record_id",
+]
 
 
 @login_required
@@ -24,6 +47,7 @@ def template(request):
 
 @never_cache
 @login_required
+@timed("search")
 def index(request, search_type="query", search_string=""):
     """Atlas Search.
 
@@ -41,33 +65,131 @@ def index(request, search_type="query", search_string=""):
     #     return render(request, "search.html.dj")
 
     request_dict = dict(request.GET)
-
-    # create a solr instance, based on the search type.
-    solr = pysolr.Solr(
-        settings.SOLR_URL, search_handler=search_type.replace("terms", "aterms")
+    timer = request.search_timer
+
+    # results are cached until the search etl changes the index.
+    output = cached_search(
+        search_type,
+        search_string,
+        request_dict,
+        functools.partial(solr_search, search_type, search_string, request_dict, timer),
     )
 
-    # pagination
+    # break early if collection, otherwise get collection ads.
+    if search_type != "collections":
+        with timer.stage("collections"):
+            output["collections"] = build_collection_ads(output["docs"])
+
+    with timer.stage("serialize"):
+        return JsonResponse(output, safe=False)
+
+
+@never_cache
+@login_required
+@timed("federated")
+def federated(request, search_type="query", search_string=""):
+    """Search all tabs at once.
+
+    Returns the hit count of every tab and the first page of the active tab.
+    The searches run in parallel, and each is cached like a normal search.
+    """
+    request_dict = dict(request.GET)
+    timer = request.search_timer
+
+    with ThreadPoolExecutor(max_workers=len(SEARCH_TABS)) as executor:
+        counts = {
+            tab: executor.submit(
+                cached_search,
+                tab,
+                search_string,
+                {},
+                functools.partial(solr_count, tab, search_string),
+                kind="counts",
+            )
+            for tab in SEARCH_TABS
+            if tab != search_type
+        }
+
+        output = cached_search(
+            search_type,
+            search_string,
+            request_dict,
+            functools.partial(
+                solr_search, search_type, search_string, request_dict, timer
+            ),
+        )
+
+        output["counts"] = {
+            tab: output["hits"] if tab == search_type else counts[tab].result()
+            for tab in SEARCH_TABS
+        }
+
+    if search_type != "collections":
+        with timer.stage("collections"):
+            output["collections"] = build_collection_ads(output["docs"])
+
+    with timer.stage("serialize"):
+        return JsonResponse(output, safe=False)
+
+
+def solr_count(search_type, search_string):
+    """Count the hits of a search without filters."""
+    solr = get_solr(search_handler=search_type.replace("terms", "aterms"))
+
+    return solr.search(
+        build_search_string(search_string), rows=0, facet="false", hl="false"
+    ).hits
+
+
+def solr_search(search_type, search_string, request_dict, timer=None):
+    """Search solr and reshape the facets."""
+    timer = timer or Timer("search")
+
+    # get a pooled solr client, based on the search type.
+    solr = get_solr(search_handler=search_type.replace("terms", "aterms"))
+
+    # pagination. a cursor ("*" for the first page) lets solr page deep
+    # results without collecting start + rows docs. id breaks score ties so
+    # pages are stable.
     start = request_dict.get("start", [0])[0]
+    cursor = request_dict.get("cursor", [None])[0]
 
-    # pylint: disable=C0301
-    results = solr.search(
-        build_search_string(search_string),
-        fq=build_filter_query(request_dict),
-        rq="{!rerank reRankQuery=$rqq reRankDocs=1000 reRankWeight=10}",
-        rqq='(documented:1 OR executive_visibility_text:Y OR enabled_for_hyperspace_text:Y OR certification_text:"Analytics Certified")',  # noqa: E501
-        start=start,
-    )
+    pagination = {"cursorMark": cursor} if cursor else {"start": start}
+
+    # descriptions are not returned by default, a short summary is used.
+    fields = build_field_list(request_dict)
+
+    with timer.stage("query"):
+        query = build_search_string(search_string)
+        filter_query = build_filter_query(request_dict)
+
+    with timer.stage("solr"):
+        results = solr.search(
+            **build_ranking(query),
+            fq=filter_query,
+            sort="score desc, id asc",
+            **pagination,
+            **fields,
+            **summary_params(),
+        )
+
+    timer.add("qtime", results.qtime or 0)
+
+    # clients that ask for the description get all of it.
+    if not {"*", "description"} & set(fields.get("fl", "").split(",")):
+        add_summaries(results.docs, results.highlighting)
 
     output = {
         "docs": results.docs,
         "facets": {},
         "hits": results.hits,
         "start": start,
+        "cursor": cursor,
+        "next_cursor": results.nextCursorMark,
         "search_filters": {**request_dict, **{"type": search_type or "query"}},
     }
 
-    with contextlib.suppress(AttributeError):
+    with timer.stage("facets"), contextlib.suppress(AttributeError):
         output["facets"] = copy.deepcopy(results.facets)
 
         for attr, _value in clean_dict(
@@ -79,13 +201,76 @@ def index(request, search_type="query", search_string=""):
                 field: fields[(num * 2) + 1] for num, field in enumerate(fields[::2])
             }
 
-    # break early if collection, otherwise get collection ads.
-    if search_type == "collections":
-        return JsonResponse(output, safe=False)
+    return output
 
-    output["collections"] = build_collection_ads(results.docs)
 
-    return JsonResponse(output, safe=False)
+def build_ranking(query):
+    """Build the ranking params of a search.
+
+    Scores are multiplied by the quality score the report ETL indexes and
+    by a log of the report run rank, so popular reports rank higher. Docs
+    without them (everything but reports) keep their score. The older
+    rerank of the top 1000 hits is kept behind SEARCH_RERANK for comparison.
+    """
+    if settings.SEARCH_RERANK:
+        # pylint: disable=C0301
+        return {
+            "q": query,
+            "rq": "{!rerank reRankQuery=$rqq reRankDocs=1000 reRankWeight=10}",
+            "rqq": '(documented:1 OR executive_visibility_text:Y OR enabled_for_hyperspace_text:Y OR certification_text:"Analytics Certified")',  # noqa: E501
+        }
+
+    return {
+        "q": "{!boost b=$qb v=$qq}",
+        "qq": query,
+        "qb": "product(def(quality_score,1),sum(1,log(sum(1,def(runs,0)))))",
+    }
+
+
+def build_field_list(request_dict):
+    """Build the solr field list from the "fields" param.
+
+    The handlers return the fields needed for the result cards. API clients
+    can ask for more, e.g. ``fields=description,source_server_text`` or
+    ``fields=*``.
+    """
+    fields = [
+        field
+        for value in request_dict.get("fields", [])
+        for field in value.split(",")
+        if field == "*" or re.fullmatch(r"\w+", field)
+    ]
+
+    if not fields:
+        return {}
+
+    return {"fl": ",".join(CARD_FIELDS + fields)}
+
+
+def summary_params():
+    """Highlighting params to get a short description summary per hit.
+
+    Hits that do not match in the description get the start of it instead.
+    """
+    return {
+        "hl": "true",
+        "hl.method": "unified",
+        "hl.fl": "description",
+        "hl.snippets": 1,
+        "hl.fragsize": settings.SEARCH_SUMMARY_LENGTH,
+        "hl.defaultSummary": "true",
+        "hl.tag.pre": "",
+        "hl.tag.post": "",
+    }
+
+
+def add_summaries(docs, highlighting):
+    """Use the highlighted summary as the description of each hit."""
+    for doc in docs:
+        summary = (highlighting or {}).get(doc.get("id"), {}).get("description")
+
+        if summary:
+            doc["description"] = [summary[0][: settings.SEARCH_SUMMARY_LENGTH]]
 
 
 def clean_dict(my_dict):
@@ -110,16 +295,7 @@ def build_collection_ads(docs):
     )
 
     # get collections from results
-    return list(
-        Collections.objects.filter(
-            Q(terms__term__term_id__in=term_ids)
-            | Q(reports__report__report_id__in=report_ids)
-        )
-        .filter(Q(hidden__isnull=True) | Q(hidden="N"))
-        .all()
-        .values("collection_id", "search_summary", "name")
-        .distinct()
-    )
+    return get_collection_ads(report_ids, term_ids)
 
 
 def build_search_string(search_string, search_type=None):
@@ -189,8 +365,12 @@ def build_filter_query(request_dict):
             "{!tag=visibility_text}visibility_text:Y OR {!tag=visibility_text}visibility_text:N"
         )
 
-    request_dict = request_dict.pop("visibility_text")
-    request_dict = request_dict.pop("start")
+    # visibility, pagination and the field list are not field filters.
+    request_dict = {
+        key: values
+        for key, values in request_dict.items()
+        if key not in ["visibility_text", "start", "cursor", "fields"]
+    }
 
     for key, values in request_dict.items():
         # it is possible to have multiple filters
@@ -211,81 +391,127 @@ def build_filter_query(request_dict):
     return ",".join(filter_query)
 
 
+def solr_lookup(search_handler, query, **kwargs):
+    """Run a dropdown lookup against solr.
+
+    Identical lookups running at the same time share one solr request.
+    """
+
+    def search():
+        results = get_solr(search_handler=search_handler).search(
+            query, **kwargs, **{"rows": 20}
+        )
+
+        return [
+            {"ObjectId": item.get("atlas_id"), "Name": item.get("name")}
+            for item in results
+        ]
+
+    return single_flight(flight_key(search_handler, query, kwargs), search)
+
+
 @never_cache
 @login_required
+@timed("users")
 def user_lookup(request, role=None):
     """User lookup."""
-    solr = pysolr.Solr(settings.SOLR_URL, search_handler="users")
+    # prefix matches come from memory, role and fuzzy lookups from solr.
+    with request.search_timer.stage("lookup"):
+        output = [] if role else typeahead.search("users", request.GET.get("s"))
+    if output:
+        return JsonResponse(output, safe=False)
 
-    results = solr.search(
-        build_search_string(request.GET.get("s"), search_type="fuzzy"),
-        fq=("user_roles:%s" % role if role else "*:*"),
-        **{"rows": 20}
-    )
+    with request.search_timer.stage("solr"):
+        output = solr_lookup(
+            "users",
+            build_search_string(request.GET.get("s"), search_type="fuzzy"),
+            fq=("user_roles:%s" % role if role else "*:*"),
+        )
 
-    output = [
-        {"ObjectId": item.get("atlas_id"), "Name": item.get("name")} for item in results
-    ]
     return JsonResponse(output, safe=False)
 
 
 @never_cache
 @login_required
+@timed("collections")
 def collection_lookup(request):
     """Dropdown lookup for collections."""
-    search_string = build_search_string(request.GET.get("s"), search_type="fuzzy")
+    # prefix matches come from memory, fuzzy misses from solr.
+    with request.search_timer.stage("lookup"):
+        output = typeahead.search("collections", request.GET.get("s"))
+    if output:
+        return JsonResponse(output, safe=False)
 
-    solr = pysolr.Solr(settings.SOLR_URL, search_handler="collections")
+    search_string = build_search_string(request.GET.get("s"), search_type="fuzzy")
 
-    results = solr.search(build_search_string(search_string), **{"rows": 20})
+    with request.search_timer.stage("solr"):
+        output = solr_lookup("collections", build_search_string(search_string))
 
-    output = [
-        {"ObjectId": item.get("atlas_id"), "Name": item.get("name")} for item in results
-    ]
     return JsonResponse(output, safe=False)
 
 
 @never_cache
 @login_required
+@timed("reports")
 def report_lookup(request):
     """Report lookup."""
-    search_string = build_search_string(request.GET.get("s"), search_type="fuzzy")
+    # prefix matches come from memory, fuzzy misses from solr.
+    with request.search_timer.stage("lookup"):
+        output = typeahead.search("reports", request.GET.get("s"))
+    if output:
+        return JsonResponse(output, safe=False)
 
-    solr = pysolr.Solr(settings.SOLR_URL, search_handler="reports")
+    search_string = build_search_string(request.GET.get("s"), search_type="fuzzy")
 
-    results = solr.search(build_search_string(search_string), **{"rows": 20})
+    with request.search_timer.stage("solr"):
+        output = solr_lookup("reports", build_search_string(search_string))
 
-    output = [
-        {"ObjectId": item.get("atlas_id"), "Name": item.get("name")} for item in results
-    ]
     return JsonResponse(output, safe=False)
 
 
 @never_cache
 @login_required
+@timed("terms")
 def term_lookup(request):
     """Term lookup."""
-    search_string = build_search_string(request.GET.get("s"), search_type="fuzzy")
+    # prefix matches come from memory, fuzzy misses from solr.
+    with request.search_timer.stage("lookup"):
+        output = typeahead.search("terms", request.GET.get("s"))
+    if output:
+        return JsonResponse(output, safe=False)
 
-    solr = pysolr.Solr(settings.SOLR_URL, search_handler="aterms")
+    search_string = build_search_string(request.GET.get("s"), search_type="fuzzy")
 
-    results = solr.search(build_search_string(search_string), **{"rows": 20})
+    with request.search_timer.stage("solr"):
+        output = solr_lookup("aterms", build_search_string(search_string))
 
-    output = [
-        {"ObjectId": item.get("atlas_id"), "Name": item.get("name")} for item in results
-    ]
     return JsonResponse(output, safe=False)
 
 
-@never_cache
+def lookup_etag(request, lookup):
+    """Get the ETag of a dropdown lookup.
+
+    Without a persistent cache the list is queried for each request, so no
+    ETag is used rather than querying it twice.
+    """
+    if not cache_is_persistent():
+        return None
+
+    return get_lookup(lookup)[1]
+
+
 @login_required
+@timed("lookups")
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=lookup_etag)
 def dropdown_lookup(request, lookup):
-    """Mini search for dropdowns."""
-    solr = pysolr.Solr(settings.SOLR_LOOKUP_URL)
+    """Mini search for dropdowns.
 
-    lookup_values = [
-        {"ObjectId": value.get("atlas_id"), "Name": value.get("item_name")}
-        for value in solr.search("item_type:%s" % lookup, **{"rows": 9999})
-    ]
+    Lookups are served from memory. Browsers revalidate with the ETag
+    and get a 304 until the lookup ETL changes the list.
+    """
+    with request.search_timer.stage("lookup"):
+        output = get_lookup(lookup)[0]
 
-    return JsonResponse(lookup_values, safe=False)
+    with request.search_timer.stage("serialize"):
+        return JsonResponse(output, safe=False)
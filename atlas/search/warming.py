@@ -0,0 +1,108 @@
+"""Search warming.
+
+After the search ETL reloads a type, solr opens a new searcher with empty
+caches and the first searches of the day are slow. The ETL tasks replay the
+most frequent recent searches of every tab from the analytics log before
+they finish, which warms the solr caches and fills the search result cache.
+"""
+import functools
+import logging
+from datetime import timedelta
+from urllib.parse import parse_qs, unquote
+
+import pysolr
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from index.models import Analytics
+
+from .cache import cached_search
+from .views import SEARCH_TABS, solr_search
+
+logger = logging.getLogger(__name__)
+
+
+def parse_search(pathname, search):
+    """Get the search type, search string and params of a logged page.
+
+    Search pages are logged as ``/search/<type>/<search string>``, with the
+    instant search and federated prefixes, or as ``/search?s=<search
+    string>``. Returns None for pages that are not a search.
+    """
+    parts = [unquote(part) for part in pathname.strip("/").split("/")]
+
+    if parts[0].lower() != "search":
+        return None
+
+    parts = parts[1:]
+    if parts and parts[0] in ["instant_search", "federated"]:
+        parts = parts[1:]
+
+    request_dict = parse_qs(search.lstrip("?"))
+
+    if not parts:
+        search_type = "query"
+        search_string = request_dict.pop("s", [""])[0]
+    elif len(parts) == 2 and parts[0] in SEARCH_TABS:
+        search_type, search_string = parts
+    else:
+        return None
+
+    # pages past the first are not worth warming.
+    request_dict.pop("start", None)
+    request_dict.pop("cursor", None)
+
+    if not search_string:
+        return None
+
+    return search_type, search_string, request_dict
+
+
+def top_searches():
+    """Get the most frequent recent searches of every tab.
+
+    Yields (search type, search string, params).
+    """
+    pages = (
+        Analytics.objects.filter(
+            pathname__istartswith="/search",
+            access_date__gte=timezone.now() - timedelta(days=settings.SEARCH_WARM_DAYS),
+        )
+        .values("pathname", "search")
+        .annotate(count=Count("analytics_id"))
+        .order_by("-count")
+    )
+
+    count = 0
+    for page in pages.iterator():
+        search = parse_search(page["pathname"], page["search"])
+
+        if search is None:
+            continue
+
+        yield search
+
+        count += 1
+        if count >= settings.SEARCH_WARM_COUNT:
+            return
+
+
+def warm_searches():
+    """Replay the most frequent searches. Returns the number replayed."""
+    count = 0
+
+    for search_type, search_string, request_dict in top_searches():
+        try:
+            cached_search(
+                search_type,
+                search_string,
+                request_dict,
+                functools.partial(
+                    solr_search, search_type, search_string, request_dict
+                ),
+            )
+            count += 1
+        except pysolr.SolrError as e:
+            logger.warning("Search warming failed for %r: %s", search_string, e)
+
+    return count